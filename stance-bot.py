@@ -1,79 +1,1527 @@
 import rg
 import itertools
+import collections
 import random
+import array
+import os
+import time
+import json
+import atexit
+import struct
+import copy
+import operator
 
 #import traceback
 #import sys
 
 
+# tile type bitmasks, mirroring rg.loc_types()
+TILE_NORMAL = 1
+TILE_SPAWN = 2
+TILE_OBSTACLE = 4
+TILE_INVALID = 8
+
+TILE_TYPE_BITS = {'normal': TILE_NORMAL, 'spawn': TILE_SPAWN, 'obstacle': TILE_OBSTACLE, 'invalid': TILE_INVALID}
+
+
+class Profiler:
+	"""Wall clock profile of the decision stages, switched on by setting the
+	STANCE_BOT_PROFILE environment variable to an output path prefix.
+	When it is not set, profiled() hands every function back untouched.
+
+	At match end (process exit, or an explicit dump()) writes
+	<prefix>.<player_id>.json with per stage, per turn and per robot times
+	and call counts, and <prefix>.<player_id>.folded with each stack's self
+	time in microseconds, in the collapsed format of flamegraph.pl.
+
+	Constructor:
+		Profiler(path_prefix)
+
+	Public methods:
+		function wrap(stage, func, robot_of=None)
+		dict summary()
+		dump()"""
+
+	clock = getattr(time, 'perf_counter', time.time)
+
+	def __init__(self, path_prefix):
+
+		self.path_prefix = path_prefix
+		self.player_id = None
+		self.turn = None
+
+		self.__stack = [] # open frames: [stage, start, time spent in children]
+		self.stages = {} # stage -> [calls, inclusive seconds, self seconds]
+		self.turns = {} # turn -> stage -> inclusive seconds
+		self.robots = {} # turn -> location -> stage -> inclusive seconds
+		self.stacks = {} # 'stage;stage;...' -> self seconds
+		self.__dumped = False
+
+		atexit.register(self.dump)
+
+
+	def wrap(self, stage, func, robot_of=None):
+		"""Return func timed as stage. robot_of(*args) -> (turn, location, player_id)
+		marks the stages that run on behalf of a single robot."""
+
+		profiler = self
+
+		def profiled_func(*args, **kwargs):
+			location = None
+			if robot_of is not None:
+				profiler.turn, location, profiler.player_id = robot_of(*args)
+
+			frame = [stage, profiler.clock(), 0.0]
+			profiler.__stack.append(frame)
+			try:
+				return func(*args, **kwargs)
+			finally:
+				elapsed = profiler.clock() - frame[1]
+				profiler.__record(elapsed, frame[2], location)
+
+		profiled_func.__name__ = func.__name__
+		profiled_func.__doc__ = func.__doc__
+		return profiled_func
+
+
+	def __record(self, elapsed, children, location):
+		"""Helper method. Account for the frame on top of the stack and pop it."""
+
+		stage = self.__stack[-1][0]
+		path = ';'.join(frame[0] for frame in self.__stack)
+		self.__stack.pop()
+		if self.__stack:
+			self.__stack[-1][2] += elapsed
+
+		totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+		totals[0] += 1
+		totals[1] += elapsed
+		totals[2] += elapsed - children
+		self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - children
+
+		turn = self.turns.setdefault(self.turn, {})
+		turn[stage] = turn.get(stage, 0.0) + elapsed
+		if not self.__stack:
+			turn['total'] = turn.get('total', 0.0) + elapsed
+		if location is not None:
+			robot = self.robots.setdefault(self.turn, {}).setdefault('%d,%d' % location, {})
+			robot[stage] = robot.get(stage, 0.0) + elapsed
+
+
+	def summary(self):
+		"""Return the aggregated profile as plain data."""
+
+		return {
+			'player_id': self.player_id,
+			'stages': dict((stage, {'calls': calls, 'seconds': total, 'self_seconds': own})
+				for stage, (calls, total, own) in self.stages.items()),
+			'counters': {
+				'RobotCalculations': self.stages.get('RobotCalculations', [0])[0],
+				'enemies_around': self.stages.get('enemies_around', [0])[0],
+				'pattern_cache': PATTERN_CACHE.stats(),
+			},
+			'turns': dict((str(turn), stages) for turn, stages in self.turns.items()),
+			'robots': dict((str(turn), robots) for turn, robots in self.robots.items()),
+		}
+
+
+	def dump(self):
+		"""Write the profile files, once."""
+
+		if self.__dumped or not self.stages:
+			return
+		self.__dumped = True
+
+		prefix = '%s.%s' % (self.path_prefix, self.player_id)
+		with open(prefix + '.json', 'w') as f:
+			json.dump(self.summary(), f, indent=1, sort_keys=True)
+		with open(prefix + '.folded', 'w') as f:
+			for path in sorted(self.stacks):
+				f.write('%s %d\n' % (path, int(round(self.stacks[path] * 1e6))))
+
+
+PROFILER = None
+if os.environ.get('STANCE_BOT_PROFILE'):
+	PROFILER = Profiler(os.environ['STANCE_BOT_PROFILE'])
+
+
+def profiled(stage, robot_of=None):
+	"""Decorator timing a function as a profiler stage (a no-op unless profiling)."""
+
+	def decorate(func):
+		if PROFILER is None:
+			return func
+		return PROFILER.wrap(stage, func, robot_of)
+	return decorate
+
+
+def robot_calculations_robot(calc, *args, **kwargs):
+	return calc.game.turn, calc.robot.location, calc.robot.player_id
+
+
+class lazy(object):
+	"""Decorator turning a method into a field computed on first access, then
+	stored on the instance (which must be of a new-style class) in its place."""
+
+	def __init__(self, func):
+		self.func = func
+		self.__name__ = func.__name__
+		self.__doc__ = func.__doc__
+
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self
+		value = self.func(instance)
+		instance.__dict__[self.__name__] = value
+		return value
+
+
+# one random stream for the whole match, so that decisions can be replayed:
+# seeded from STANCE_BOT_SEED if set (or later through seed_random()),
+# from the OS otherwise
+MATCH_RANDOM = random.Random()
+MATCH_SEED = None
+
+def seed_random(seed=None):
+	"""Restart the match's random stream from seed (None: a new one from the OS,
+	so that MATCH_SEED and the recording always hold the seed actually used)."""
+
+	global MATCH_SEED
+	if seed is None:
+		seed = random.SystemRandom().getrandbits(62)
+	MATCH_SEED = seed
+	MATCH_RANDOM.seed(seed)
+	if RECORDER is not None:
+		RECORDER.seeded(seed)
+
+
+class Recorder:
+	"""Binary log of every turn the bot sees and every move it returns,
+	switched on by setting STANCE_BOT_RECORD to an output path prefix.
+
+	Writes <prefix>.<player_id>.replay as fixed size little-endian records
+	(RECORD_SIZE bytes, kind first), so that a replayer can memory-map it
+	and walk it by offset:
+		REC_SEED    the match random stream was (re)seeded
+		REC_TURN    a new turn: turn number, player id, number of robots
+		REC_ROBOT   one robot of that turn: location, hp, owner, robot id
+		REC_ACTION  one act() call: robot location, action code, target
+	A match not seeded otherwise gets a random seed at load time, so every
+	recording can be replayed exactly.
+
+	Constructor:
+		Recorder(path_prefix)
+
+	Public methods:
+		record(game, robot, move)
+		seeded(seed)
+		close()"""
+
+	def __init__(self, path_prefix):
+
+		self.path_prefix = path_prefix
+		self.__file = None
+		self.__game = None
+		self.__turn = None
+
+		atexit.register(self.close)
+
+
+	def record(self, game, robot, move):
+
+		if self.__file is None:
+			self.__file = open('%s.%d.replay' % (self.path_prefix, robot.player_id), 'wb')
+			self.seeded(MATCH_SEED)
+
+		if game is not self.__game or game.turn != self.__turn:
+			self.__game = game
+			self.__turn = game.turn
+			self.__write(RECORD.pack(REC_TURN, game.turn, 0, 0, 0, robot.player_id, 0, 0, 0, len(game.robots)))
+			for loc in sorted(game.robots):
+				rob = game.robots[loc]
+				robot_id = getattr(rob, 'robot_id', None)
+				self.__write(RECORD.pack(REC_ROBOT, game.turn, loc[0], loc[1], rob.hp, rob.player_id,
+					0, 0, 0, -1 if robot_id is None else robot_id))
+
+		target = move[1] if len(move) > 1 else (0, 0)
+		self.__write(RECORD.pack(REC_ACTION, game.turn, robot.location[0], robot.location[1], robot.hp,
+			robot.player_id, ACTION_CODES[move[0]], target[0], target[1], getattr(robot, 'robot_id', -1)))
+
+	def seeded(self, seed):
+		if self.__file is not None:
+			self.__write(SEED_RECORD.pack(REC_SEED, seed))
+
+	def __write(self, data):
+		self.__file.write(data)
+
+	def close(self):
+		if self.__file is not None:
+			self.__file.close()
+			self.__file = None
+
+
+# replay records: kind, turn, x, y, hp, player_id, action, target x, target y, robot_id (or count)
+RECORD = struct.Struct('<BHbbhbbbbix')
+SEED_RECORD = struct.Struct('<B7xq')
+RECORD_SIZE = RECORD.size
+REC_SEED, REC_TURN, REC_ROBOT, REC_ACTION = 1, 2, 3, 4
+ACTIONS = ('move', 'attack', 'guard', 'suicide')
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS, 1))
+
+RECORDER = None
+if os.environ.get('STANCE_BOT_RECORD'):
+	RECORDER = Recorder(os.environ['STANCE_BOT_RECORD'])
+
+class Params(object):
+	"""The bot's tunable thresholds, one typed field per entry of FIELDS.
+	Loaded once at startup: the defaults, overridden by the JSON object in the
+	file STANCE_BOT_PARAMS names (see tools/autotune.py), if it is set.
+
+	Constructor:
+		Params(**values) -> unknown names raise TypeError, values that do not
+			convert to the field's type or fall outside its bounds raise ValueError
+
+	Fields:
+		float quadrant_ratio -> our quadrant is outnumbered when foes exceed friends times this
+		int quadrant_min_friends -> with fewer friends than this, as many foes outnumber them
+		int opening_turns -> turns at the start spent heading for the centre
+		int chase_distance -> how far a cautious robot at its destination looks for enemies
+		int group_support -> a robot in a group this big holds against a lone enemy even when outnumbered
+		float danger_ratio -> a robot is about to die when the damage it may take exceeds its HP times this
+		float lookahead_deadline_ms -> see LOOKAHEAD_DEADLINE
+		int lookahead_max_depth
+		int pattern_cache_size
+		int history_turns
+		int history_span
+		int sectors -> 0 for the default pinwheel quadrants, n for sector_layout(n)
+
+	Public methods:
+		Params load(path)
+		Params from_environment()
+		dict as_dict()"""
+
+	# name, type, default, lowest and highest accepted value (None: unbounded)
+	FIELDS = (
+		('quadrant_ratio', float, 1.5, 0, None),
+		('quadrant_min_friends', int, 2, 0, None),
+		('opening_turns', int, 3, 0, None),
+		('chase_distance', int, 3, 0, None),
+		('group_support', int, 3, 0, None),
+		('danger_ratio', float, 1.0, 0, None),
+		('lookahead_deadline_ms', float, float(os.environ.get('STANCE_BOT_DEADLINE_MS', 100)), 0, None),
+		('lookahead_max_depth', int, 2, 0, None),
+		('pattern_cache_size', int, 4096, 1, None),
+		('history_turns', int, 8, 1, None),
+		('history_span', int, 2, 0, None),
+		('sectors', int, 0, 0, 19),
+	)
+
+	def __init__(self, **values):
+
+		for name, kind, default, lowest, highest in self.FIELDS:
+			setattr(self, name, self.__convert(name, kind, values.pop(name, default), lowest, highest))
+		if values:
+			raise TypeError('unknown parameters: %s' % ', '.join(sorted(values)))
+
+	@staticmethod
+	def __convert(name, kind, value, lowest, highest):
+		"""Helper method. Return value as kind, refusing booleans, fractions for ints
+		and values out of bounds."""
+
+		if isinstance(value, bool) or (kind is int and isinstance(value, float) and not value.is_integer()):
+			raise ValueError('%s: %r is not a valid %s' % (name, value, kind.__name__))
+		value = kind(value)
+		if lowest is not None and value < lowest:
+			raise ValueError('%s: %r is below %r' % (name, value, lowest))
+		if highest is not None and value > highest:
+			raise ValueError('%s: %r is above %r' % (name, value, highest))
+		return value
+
+	@classmethod
+	def load(cls, path):
+		with open(path) as f:
+			return cls(**dict((str(name), value) for name, value in json.load(f).items()))
+
+	@classmethod
+	def from_environment(cls):
+		if os.environ.get('STANCE_BOT_PARAMS'):
+			return cls.load(os.environ['STANCE_BOT_PARAMS'])
+		return cls()
+
+	def as_dict(self):
+		return dict((name, getattr(self, name)) for name, kind, default, lowest, highest in self.FIELDS)
+
+
+PARAMS = Params.from_environment()
+
+# lookahead search (see LocalSearch): time it may use each turn, counted from
+# the turn's first act(), and the deepest it goes. A deadline of 0 turns it off.
+LOOKAHEAD_DEADLINE = PARAMS.lookahead_deadline_ms / 1000.0
+LOOKAHEAD_MAX_DEPTH = PARAMS.lookahead_max_depth
+
+# stance decisions remembered by PatternCache
+PATTERN_CACHE_SIZE = PARAMS.pattern_cache_size
+
+# turns kept by TurnHistory, and over how many of them an enemy's movement
+# vector (and so its predicted next tile) is taken
+HISTORY_TURNS = PARAMS.history_turns
+HISTORY_SPAN = PARAMS.history_span
+
+if os.environ.get('STANCE_BOT_SEED'):
+	seed_random(int(os.environ['STANCE_BOT_SEED']))
+elif RECORDER is not None:
+	# recordings must be replayable: pick the seed ourselves
+	seed_random()
+
+
+def new_position():
+	"""Called by local harnesses before deciding a position unrelated to the
+	last one: forget the previous turns and the cached stance decisions."""
+
+	TurnData.forget()
+	PATTERN_CACHE.clear()
+
+
+def match_over():
+	"""Called by local harnesses when a match ends: write the profile and close the recording."""
+
+	if PROFILER is not None:
+		PROFILER.dump()
+	if RECORDER is not None:
+		RECORDER.close()
+
+
+	########################################################################
+
+
+class ArenaTables:
+	"""Static data about the fixed arena layout, computed once per process.
+	Built lazily on first use, once rg has its settings and map loaded.
+
+	Fields:
+		dict tile_types -> location to tile type bitmask
+		dict valid_neighbours -> locations around, not invalid (walls included)
+		dict wall_neighbours -> locations around that are walls
+		dict unobstructed_neighbours -> locations around, not invalid and not walls
+		dict normal_neighbours -> unobstructed locations around that are not spawn
+		dict spawn_neighbours -> unobstructed locations around that are spawn
+		int size
+		long board_mask -> one bit per tile, bit index y * size + x
+		long obstacle_mask
+		long spawn_mask
+		dict area_masks -> location to the bits of itself and the tiles around it
+		dict area_indices -> location to the indices of itself and the tiles around it
+		dict flow_fields -> destination to the walking distance of every tile to
+			it around walls (array by index, -1 where it cannot be reached)
+		dict spawn_exits -> spawn location to its ways out of the spawn area:
+			(distance, exit, first steps) tuples, nearest exit first
+
+	Public methods:
+		ArenaTables get()
+		int tile_type(location)
+		int index(location)
+		long bit(location)
+		long expand(mask)
+		long area_mask(location)
+		Location[] locations(mask)
+		array flow_field(destination)
+		Location step_toward(location, destination, avoid_mask=0)"""
+
+	__tables = None
+
+	def __init__(self):
+
+		self.tile_types = {}
+		self.valid_neighbours = {}
+		self.wall_neighbours = {}
+		self.unobstructed_neighbours = {}
+		self.normal_neighbours = {}
+		self.spawn_neighbours = {}
+
+		self.size = size = rg.settings.board_size
+		for loc in itertools.product(range(size), range(size)):
+			self.tile_types[loc] = self.__type_bits(loc)
+
+		# bitboards
+		self.board_mask = (1 << (size * size)) - 1
+		self.__first_col_mask = 0
+		for y in range(size):
+			self.__first_col_mask |= 1 << (y * size)
+		self.__last_col_mask = self.__first_col_mask << (size - 1)
+
+		self.obstacle_mask = 0
+		self.spawn_mask = 0
+		for loc, bits in self.tile_types.items():
+			if bits & TILE_OBSTACLE:
+				self.obstacle_mask |= self.bit(loc)
+			if bits & TILE_SPAWN:
+				self.spawn_mask |= self.bit(loc)
+
+		# one shared tuple per location, handed out by locations()
+		self.__index_locs = [(i % size, i // size) for i in range(size * size)]
+
+		self.area_masks = {}
+		self.area_indices = {}
+		for loc in self.tile_types:
+			self.area_masks[loc] = self.expand(self.bit(loc))
+			self.area_indices[loc] = tuple(self.index(l) for l in self.locations(self.area_masks[loc]))
+
+		for loc in self.tile_types:
+			valid = tuple(rg.locs_around(loc, filter_out='invalid'))
+			self.valid_neighbours[loc] = valid
+			self.wall_neighbours[loc] = tuple(
+				l for l in valid if self.tile_type(l) & TILE_OBSTACLE)
+			self.unobstructed_neighbours[loc] = tuple(
+				l for l in valid if not self.tile_type(l) & TILE_OBSTACLE)
+			self.normal_neighbours[loc] = tuple(
+				l for l in self.unobstructed_neighbours[loc] if not self.tile_type(l) & TILE_SPAWN)
+			self.spawn_neighbours[loc] = tuple(
+				l for l in self.unobstructed_neighbours[loc] if self.tile_type(l) & TILE_SPAWN)
+
+		self.spawn_exits = {}
+		for loc, bits in self.tile_types.items():
+			if bits & TILE_SPAWN and not bits & TILE_OBSTACLE:
+				self.spawn_exits[loc] = self.__exits(loc)
+
+		# the fixed destinations get their fields now, any other on first use
+		self.flow_fields = {}
+		for destination in [rg.CENTER_POINT] + [entry[2] for entry in LAYOUT]:
+			self.flow_field(tuple(destination))
+
+
+	@classmethod
+	def get(cls):
+		"""Return the tables, building them on the first call."""
+
+		if cls.__tables is None:
+			cls.__tables = cls()
+		return cls.__tables
+
+
+	def __exits(self, location):
+		"""Helper method. Breadth first search from a spawn tile across spawn
+		tiles, up to the first normal tiles (exits), keeping for each tile the
+		first steps of the shortest walks to it."""
+
+		dist = {location: 0}
+		first_steps = {location: ()}
+		exits = []
+		queue = collections.deque([location])
+		while queue:
+			loc = queue.popleft()
+			if not self.tile_type(loc) & TILE_SPAWN:
+				exits.append((dist[loc], loc, tuple(sorted(first_steps[loc]))))
+				continue
+			for nloc in self.unobstructed_neighbours[loc]:
+				steps = first_steps[loc] or (nloc,)
+				if nloc not in dist:
+					dist[nloc] = dist[loc] + 1
+					first_steps[nloc] = steps
+					queue.append(nloc)
+				elif dist[nloc] == dist[loc] + 1:
+					first_steps[nloc] = tuple(set(first_steps[nloc]) | set(steps))
+
+		return tuple(sorted(exits))
+
+
+	def __type_bits(self, location):
+		"""Helper method. Fold rg.loc_types() into a bitmask."""
+
+		bits = 0
+		for loc_type in rg.loc_types(location):
+			bits |= TILE_TYPE_BITS.get(loc_type, 0)
+		return bits
+
+
+	def tile_type(self, location):
+		"""Return the tile type bitmask of a location (TILE_INVALID if off the board)."""
+		return self.tile_types.get(location, TILE_INVALID)
+
+	def index(self, location):
+		"""Return the flat index (y * size + x) of a location, None if off the board."""
+
+		x, y = location
+		if 0 <= x < self.size and 0 <= y < self.size:
+			return y * self.size + x
+		return None
+
+	def bit(self, location):
+		"""Return the bitboard bit of a location (0 if off the board)."""
+
+		x, y = location
+		if 0 <= x < self.size and 0 <= y < self.size:
+			return 1 << (y * self.size + x)
+		return 0
+
+	def expand(self, mask):
+		"""Return mask grown by one tile in the four directions (includes mask itself)."""
+
+		return (mask
+			| ((mask << 1) & ~self.__first_col_mask)
+			| ((mask >> 1) & ~self.__last_col_mask)
+			| (mask << self.size)
+			| (mask >> self.size)) & self.board_mask
+
+	def area_mask(self, location):
+		"""Return the bits of location and the tiles around it, clipped to the board."""
+
+		mask = self.area_masks.get(location)
+		if mask is None:
+			# off the board: only its on-board neighbours count
+			x, y = location
+			mask = 0
+			for loc in ((x, y+1), (x+1, y), (x, y-1), (x-1, y)):
+				mask |= self.bit(loc)
+		return mask
+
+	def locations(self, mask):
+		"""Return the locations of the bits set in mask, lowest bit first."""
+
+		locs = []
+		index_locs = self.__index_locs
+		while mask:
+			low = mask & -mask
+			locs.append(index_locs[low.bit_length() - 1])
+			mask ^= low
+		return locs
+
+	def flow_field(self, destination):
+		"""Return the walking distances to destination, from a breadth first
+		search around walls (robots ignored), None if it is off the board.
+		A wall destination is reached by standing next to it, so the search
+		starts from its walkable neighbours. Fields only depend on the map,
+		so they are kept for the whole process."""
+
+		field = self.flow_fields.get(destination)
+		if field is None:
+			if self.index(destination) is None:
+				return None
+
+			starts = [destination]
+			if self.tile_type(destination) & TILE_OBSTACLE:
+				starts = list(self.unobstructed_neighbours[destination])
+
+			field = array.array('h', [-1]) * (self.size * self.size)
+			for loc in starts:
+				field[self.index(loc)] = 0
+			queue = collections.deque(starts)
+			while queue:
+				loc = queue.popleft()
+				dist = field[self.index(loc)] + 1
+				for nloc in self.unobstructed_neighbours[loc]:
+					ni = self.index(nloc)
+					if field[ni] < 0:
+						field[ni] = dist
+						queue.append(nloc)
+			self.flow_fields[destination] = field
+		return field
+
+	def step_toward(self, location, destination, avoid_mask=0):
+		"""Return the next tile of a shortest walk from location to destination:
+		rg.toward()'s step if it is on one, unless it is in avoid_mask (e.g.
+		friends) and another equally short step is not. location itself if
+		already there; rg.toward() if no walk exists or location already
+		stands next to a wall destination."""
+
+		if location == destination:
+			return location
+
+		field = self.flow_field(destination)
+		i = self.index(location)
+		if field is None or i is None or field[i] <= 0:
+			return rg.toward(location, destination)
+
+		# rg.toward()'s greedy step first, when it is one of the shortest
+		steps = [loc for loc in self.unobstructed_neighbours[location] if field[self.index(loc)] == field[i] - 1]
+		greedy = rg.toward(location, destination)
+		if greedy in steps:
+			steps.remove(greedy)
+			steps.insert(0, greedy)
+
+		for loc in steps:
+			if not self.bit(loc) & avoid_mask:
+				return loc
+		if not steps:
+			return rg.toward(location, destination)
+		return steps[0]
+
+
+	########################################################################
+
+
+class ThreatMap:
+	"""Per-turn heatmap of enemy pressure over the whole arena, one flat list
+	per feature, indexed like the bitboards (y * size + x).
+
+	Constructor:
+		ThreatMap(turn_data, previous=None) -> patched from the previous turn's
+			map when turn_data.changes lists what changed since; its lists are
+			then taken over, leaving previous unusable
+
+	Fields:
+		int[] enemy_counts -> enemies on or next to each tile
+		int[] low_hp_counts -> those of them with less HP than an average attack
+		int[] idle_counts -> those of them not busy with one of our robots
+		int[] damages -> expected incoming damage on each tile
+		int avg_attack
+
+	Public methods:
+		int enemy_count(location)
+		int damage(location)
+		boolean can_flank(location)"""
+
+	def __init__(self, turn_data, previous=None):
+
+		self.tables = ArenaTables.get()
+		self.turn_data = turn_data
+
+		low, high = rg.settings.attack_range
+		self.avg_attack = (low + high)//2
+
+		# pessimistic: average attack leaning towards the lowest roll
+		self.__damage_per_enemy = self.avg_attack + low
+
+		if previous is not None and turn_data.changes is not None:
+			self.__update(previous)
+		else:
+			tiles = self.tables.size * self.tables.size
+			self.enemy_counts = [0] * tiles
+			self.low_hp_counts = [0] * tiles
+			self.idle_counts = [0] * tiles
+
+			for foe in turn_data.total_foes:
+				self.__count(foe.location, foe.hp, turn_data.friends_mask, 1)
+
+			self.damages = [(count * self.__damage_per_enemy)//2 for count in self.enemy_counts]
+
+
+	def __update(self, previous):
+		"""Helper method. Start from the previous turn's counts, take out the
+		foes that moved, were hurt or died, and those whose busy status may
+		have changed (next to a tile a friend left or entered), then count
+		them again as they are now."""
+
+		self.enemy_counts = previous.enemy_counts
+		self.low_hp_counts = previous.low_hp_counts
+		self.idle_counts = previous.idle_counts
+		self.damages = previous.damages
+		previous.enemy_counts = previous.low_hp_counts = previous.idle_counts = previous.damages = None
+
+		before = previous.turn_data
+		removed, added = self.turn_data.changes
+		rechecked = self.tables.expand(before.friends_mask ^ self.turn_data.friends_mask)
+
+		removed_mask = 0
+		for rob in removed:
+			removed_mask |= self.tables.bit(rob.location)
+		added_mask = 0
+		for rob in added:
+			added_mask |= self.tables.bit(rob.location)
+
+		recounted = before.foes_mask & (rechecked | removed_mask)
+		for loc in self.tables.locations(recounted):
+			self.__count(loc, before.snapshot.robot_at(loc).hp, before.friends_mask, -1)
+		counted = self.turn_data.foes_mask & (rechecked | added_mask)
+		for loc in self.tables.locations(counted):
+			self.__count(loc, self.turn_data.snapshot.robot_at(loc).hp, self.turn_data.friends_mask, 1)
+
+		for i in self.tables.locations(self.tables.expand(recounted | counted)):
+			i = self.tables.index(i)
+			self.damages[i] = (self.enemy_counts[i] * self.__damage_per_enemy)//2
+
+
+	def __count(self, location, hp, friends_mask, step):
+		"""Helper method. Add step times the foe at location to the counts of the tiles it reaches."""
+
+		low_hp = hp < self.avg_attack
+		idle = not self.tables.area_mask(location) & friends_mask
+		for i in self.tables.area_indices[location]:
+			self.enemy_counts[i] += step
+			if low_hp:
+				self.low_hp_counts[i] += step
+			if idle:
+				self.idle_counts[i] += step
+
+
+	def __at(self, values, location):
+		"""Helper method. Value of a per-tile list at location, 0 off the board."""
+
+		i = self.tables.index(location)
+		if i is None:
+			return 0
+		return values[i]
+
+	def enemy_count(self, location):
+		return self.__at(self.enemy_counts, location)
+
+	def damage(self, location):
+		return self.__at(self.damages, location)
+
+	def can_flank(self, location):
+		"""True if every enemy next to location is busy with a friend, and
+		not all of them are about to die anyway."""
+
+		if self.tables.bit(location) & self.turn_data.robots_mask:
+			return False
+
+		count = self.enemy_count(location)
+		return (count > 0 and self.__at(self.idle_counts, location) == 0
+			and count != self.__at(self.low_hp_counts, location))
+
+
+	########################################################################
+
+
+class NearestFoeField:
+	"""Per-turn walking distance from every tile to the closest enemy, around
+	walls, from a single breadth first search started on all enemies at once.
+	Ties go to the enemy with the lowest HP.
+
+	Constructor:
+		NearestFoeField(turn_data)
+
+	Fields:
+		int[] distances -> per tile, -1 where no enemy can be reached
+		Location[] foes -> per tile, location of the closest enemy (or None)
+
+	Public methods:
+		Location nearest(location)"""
+
+	def __init__(self, turn_data):
+
+		self.tables = ArenaTables.get()
+
+		tiles = self.tables.size * self.tables.size
+		self.distances = array.array('h', [-1]) * tiles
+		self.foes = [None] * tiles
+
+		# seeding the queue weakest first makes every layer keep that order,
+		# so a tile is claimed by the weakest of its closest enemies
+		queue = collections.deque()
+		for foe in sorted(turn_data.total_foes, key=lambda rob: (rob.hp, rob.location)):
+			i = self.tables.index(foe.location)
+			if i is not None and self.distances[i] < 0:
+				self.distances[i] = 0
+				self.foes[i] = foe.location
+				queue.append(foe.location)
+
+		while queue:
+			loc = queue.popleft()
+			i = self.tables.index(loc)
+			for nloc in self.tables.unobstructed_neighbours[loc]:
+				ni = self.tables.index(nloc)
+				if ni is not None and self.distances[ni] < 0:
+					self.distances[ni] = self.distances[i] + 1
+					self.foes[ni] = self.foes[i]
+					queue.append(nloc)
+
+
+	def nearest(self, location):
+		i = self.tables.index(location)
+		if i is None:
+			return None
+		return self.foes[i]
+
+
+	########################################################################
+
+
+# quadrant geometry, one entry per quadrant (numbered from 1):
+# (min_corner, size, center, twin quadrant number).
+# The default pinwheel splits the arena in four overlapping quadrants;
+# sector_layout(n) gives a finer n x n partition instead.
+QUADRANT_LAYOUT = (
+	((9, 0), (9, 10), (12, 6), 2),
+	((0, 0), (10, 9), (6, 6), 1),
+	((0, 8), (9, 10), (6, 12), 4),
+	((8, 9), (10, 9), (12, 12), 3),
+)
+
+def sector_layout(n, board_size=19):
+	"""Return a layout splitting the arena in n x n sectors, numbered row by row.
+	A sector's twin is its mirror image across the vertical axis."""
+
+	layout = []
+	bounds = [board_size * k // n for k in range(n + 1)]
+	for row in range(n):
+		for col in range(n):
+			min_corner = (bounds[col], bounds[row])
+			size = (bounds[col+1] - bounds[col], bounds[row+1] - bounds[row])
+			center = (min_corner[0] + size[0] // 2, min_corner[1] + size[1] // 2)
+			twin = row * n + (n - 1 - col) + 1
+			layout.append((min_corner, size, center, twin))
+	return tuple(layout)
+
+# the layout of every turn's quadrants (see Params.sectors)
+LAYOUT = sector_layout(PARAMS.sectors) if PARAMS.sectors > 0 else QUADRANT_LAYOUT
+
+
+class RegionStats:
+	"""Per-turn summed-area tables of the arena, so that any rectangle's
+	robot counts and HP cost four lookups. Built on the first query.
+
+	Constructor:
+		RegionStats(turn_data)
+
+	Public methods:
+		int friends(min_corner, max_corner)
+		int foes(min_corner, max_corner)
+		int friend_hp(min_corner, max_corner)
+		int foe_hp(min_corner, max_corner)"""
+
+	def __init__(self, turn_data):
+
+		self.width = ArenaTables.get().size + 1
+		self.__turn_data = turn_data
+		self.__tables = None
+
+
+	def __build(self):
+		"""Helper method. Fill and integrate the friends, foes, friend HP and foe HP tables."""
+
+		cells = self.width * self.width
+		# flat int arrays: the running sums are not boxed one by one
+		friends, foes, friend_hp, foe_hp = tables = [array.array('i', [0]) * cells for _ in range(4)]
+
+		for rob in self.__turn_data.total_friends:
+			self.__add(friends, friend_hp, rob)
+		for rob in self.__turn_data.total_foes:
+			self.__add(foes, foe_hp, rob)
+
+		for table in tables:
+			self.__integrate(table)
+		self.__tables = tables
+
+
+	def __add(self, counts, hps, robot):
+		"""Helper method. Drop a robot in its cell, shifted by one so row and column 0 stay empty."""
+
+		x, y = robot.location
+		if 0 <= x < self.width - 1 and 0 <= y < self.width - 1:
+			i = (y + 1) * self.width + x + 1
+			counts[i] += 1
+			hps[i] += robot.hp
+
+	def __integrate(self, table):
+		"""Helper method. Turn per-cell values into sums over [0, x] x [0, y]."""
+
+		w = self.width
+		for y in range(1, w):
+			row = 0
+			for x in range(1, w):
+				row += table[y * w + x]
+				table[y * w + x] = table[(y - 1) * w + x] + row
+
+	def __sum(self, table_num, min_corner, max_corner):
+		"""Helper method. Sum over the rectangle [min_corner, max_corner) of a table."""
+
+		if self.__tables is None:
+			self.__build()
+		table = self.__tables[table_num]
+
+		w = self.width
+		x0, y0 = [max(0, min(c, w - 1)) for c in min_corner]
+		x1, y1 = [max(0, min(c, w - 1)) for c in max_corner]
+		if x1 <= x0 or y1 <= y0:
+			return 0
+		return table[y1 * w + x1] - table[y0 * w + x1] - table[y1 * w + x0] + table[y0 * w + x0]
+
+	def friends(self, min_corner, max_corner):
+		return self.__sum(0, min_corner, max_corner)
+
+	def foes(self, min_corner, max_corner):
+		return self.__sum(1, min_corner, max_corner)
+
+	def friend_hp(self, min_corner, max_corner):
+		return self.__sum(2, min_corner, max_corner)
+
+	def foe_hp(self, min_corner, max_corner):
+		return self.__sum(3, min_corner, max_corner)
+
+
+	########################################################################
+
+
 class Quadrant:
-	"""A cartesian quadrant section of the arena.
-	Properties currently hardcoded.
+	"""A rectangular section of the arena, as described by an entry of
+	QUADRANT_LAYOUT. Counts are read from the turn's RegionStats.
 
 	Constructor:
-		Quadrant(quad_num)
+		Quadrant(layout_entry, region_stats)
 
 	Fields:
 		Location min_corner
-		Location max_corner
+		Location max_corner -> exclusive
 		Location center
-		Robot[] quad_friends
-		Robot[] quad_foes
-		int twin"""
+		int friend_count
+		int foe_count
+		int friend_hp
+		int foe_hp
+		int twin
 
+	Public methods:
+		boolean contains(location)
+		Quadrant updated(player_id, removed, added)"""
 
-	def __init__(self, quad_num, arena_data):
 
-		# define min and max corners and center
+	def __init__(self, layout_entry, region_stats):
 
-		min_corner = []
-		size = []
+		min_corner, size, center, twin = layout_entry
 
-		if quad_num == 1 or quad_num == 3:
-			size = [9,10]
-		elif quad_num == 2 or quad_num == 4:
-			size = [10,9]
+		self.min_corner = tuple(min_corner)
+		self.max_corner = (min_corner[0] + size[0], min_corner[1] + size[1])
+		self.center = tuple(center)
+		self.twin = twin
 
-		if quad_num == 1:
-			min_corner = [9,0]
-			self.center = (12,6)
-		elif quad_num == 2:
-			min_corner = [0,0]
-			self.center = (6,6)
-		elif quad_num == 3:
-			min_corner = [0,8]
-			self.center = (6,12)
-		elif quad_num == 4:
-			min_corner = [8,9]
-			self.center = (12,12)
+		# friends and foes in the quad
+		self.friend_count = region_stats.friends(self.min_corner, self.max_corner)
+		self.foe_count = region_stats.foes(self.min_corner, self.max_corner)
+		self.friend_hp = region_stats.friend_hp(self.min_corner, self.max_corner)
+		self.foe_hp = region_stats.foe_hp(self.min_corner, self.max_corner)
 
-		max_corner = [x + y for x, y in zip(min_corner, size)]
 
-		self.min_corner = list(min_corner)
-		self.max_corner = list(max_corner)
+	def contains(self, location):
+		return (self.min_corner[0] <= location[0] < self.max_corner[0]
+			and self.min_corner[1] <= location[1] < self.max_corner[1])
 
 
-		# define friends and foes in the quad
-		
-		self.quad_friends = []
-		self.quad_foes = []
+	def updated(self, player_id, removed, added):
+		"""Return a copy of the quadrant, counts adjusted for the robots that
+		left it (removed) and entered it (added), as seen by player_id."""
 
-		range_x = xrange(self.min_corner[0], self.max_corner[0])
-		range_y = xrange(self.min_corner[1], self.max_corner[1])
+		quad = copy.copy(self)
+		for step, robots in ((-1, removed), (1, added)):
+			for rob in robots:
+				if quad.contains(rob.location):
+					if rob.player_id == player_id:
+						quad.friend_count += step
+						quad.friend_hp += step * rob.hp
+					else:
+						quad.foe_count += step
+						quad.foe_hp += step * rob.hp
+		return quad
 
-		for x,y in itertools.product(range_x, range_y):
-			if (x,y) in arena_data.game.robots:
-				if arena_data.game.robots[(x,y)].player_id != arena_data.robot.player_id:
-					self.quad_foes.append(arena_data.game.robots[(x,y)])
-				else:
-					self.quad_friends.append(arena_data.game.robots[(x,y)])
 
-		# assign twin quad (link quad_num & II, and IIquad_num & IV)
+	########################################################################
+
+
+class RobotView(object):
+	"""Record of one robot of a RobotSnapshot, standing in for the engine's
+	robot objects wherever the bot needs one."""
+
+	__slots__ = ('index', 'location', 'hp', 'player_id', 'robot_id')
+
+	def __init__(self, index, location, hp, player_id, robot_id):
+		self.index = index
+		self.location = location
+		self.hp = hp
+		self.player_id = player_id
+		self.robot_id = robot_id
+
+	def __repr__(self):
+		return 'RobotView(%r, hp=%r, player_id=%r)' % (self.location, self.hp, self.player_id)
+
+
+class RobotSnapshot:
+	"""Compact copy of game.robots taken once per turn: parallel arrays of
+	x, y, hp, owner and robot id (-1 where the engine hides it), in location
+	order, plus a RobotView per robot. Everything else reads robots from here.
+
+	Constructor:
+		RobotSnapshot(robots)
+
+	Fields:
+		array xs
+		array ys
+		array hps
+		array owners
+		array robot_ids
+		dict index_of -> location to index
+		RobotView[] views -> by index
+
+	Public methods:
+		RobotView robot_at(location)
+		(RobotView[], RobotView[]) diff(previous)"""
+
+	def __init__(self, robots):
+
+		self.xs = array.array('b')
+		self.ys = array.array('b')
+		self.hps = array.array('h')
+		self.owners = array.array('b')
+		self.robot_ids = array.array('l')
+		self.index_of = {}
+		self.views = []
+
+		for loc in sorted(robots):
+			rob = robots[loc]
+			robot_id = getattr(rob, 'robot_id', None)
+			index = len(self.views)
+
+			self.xs.append(loc[0])
+			self.ys.append(loc[1])
+			self.hps.append(rob.hp)
+			self.owners.append(rob.player_id)
+			self.robot_ids.append(-1 if robot_id is None else robot_id)
+			self.index_of[loc] = index
+			self.views.append(RobotView(index, loc, rob.hp, rob.player_id, robot_id))
+
+
+	def robot_at(self, location):
+		"""Return the view of the robot at location, None if there is none."""
+
+		index = self.index_of.get(location)
+		if index is None:
+			return None
+		return self.views[index]
+
+
+	def diff(self, previous):
+		"""Return the robots of the previous snapshot that are not in this one
+		as they were, and the robots of this one that were not in the previous
+		one as they are. A robot that moved or lost HP is in both lists."""
+
+		def unchanged(before, i, after):
+			j = after.index_of.get(before.views[i].location)
+			return (j is not None and before.hps[i] == after.hps[j]
+				and before.owners[i] == after.owners[j] and before.robot_ids[i] == after.robot_ids[j])
+
+		removed = [view for view in previous.views if not unchanged(previous, view.index, self)]
+		added = [view for view in self.views if not unchanged(self, view.index, previous)]
+		return removed, added
+
+
+	########################################################################
+
+
+class TurnHistory:
+	"""Ring buffer of the robots of a player's last turns, keyed by track id:
+	a friend's robot_id, or for an enemy (whose id the engine hides) a
+	negative id carried over from the enemy of the turn before that it can
+	be matched with, one step away at most and with no more HP. Appending a
+	turn overwrites the oldest once capacity turns are stored, so memory
+	stays bounded however long the match. A turn that does not follow the
+	latest one starts the history over.
+
+	Constructor:
+		TurnHistory(capacity=HISTORY_TURNS)
+
+	Fields:
+		int capacity
+		int length -> turns stored
+		int latest_turn -> 0 when empty
+		dict predicted -> tile to the location of the enemy expected to step into it
+		int predicted_mask -> bits of the predicted tiles
+
+	Public methods:
+		append(turn_data)
+		Location location(track_id, turns_back=0)
+		(int, int) vector(track_id, span=HISTORY_SPAN)"""
+
+	def __init__(self, capacity=HISTORY_TURNS):
+
+		self.capacity = capacity
+		self.__slots = [None] * capacity # (turn, xs, ys, hps, owners, tracks, track -> index)
+		self.__head = -1
+		self.__next_foe_track = -1
+		self.length = 0
+		self.latest_turn = 0
+		self.predicted = {}
+		self.predicted_mask = 0
+
+
+	@profiled('TurnHistory.append')
+	def append(self, turn_data):
+		"""Store the robots of turn_data's turn and predict the enemies' next tiles."""
+
+		if self.length and turn_data.turn != self.latest_turn + 1:
+			self.length = 0
+
+		snapshot = turn_data.snapshot
+		tracks = array.array('l', snapshot.robot_ids)
+		self.__match_foes(turn_data, tracks)
+
+		self.__head = (self.__head + 1) % self.capacity
+		self.__slots[self.__head] = (turn_data.turn, snapshot.xs, snapshot.ys, snapshot.hps, snapshot.owners,
+			tracks, dict((track, i) for i, track in enumerate(tracks)))
+		self.length = min(self.length + 1, self.capacity)
+		self.latest_turn = turn_data.turn
+
+		self.__predict(turn_data)
+
+
+	def location(self, track_id, turns_back=0):
+		"""Return where a tracked robot stood turns_back turns before the latest, None if unknown."""
+
+		if turns_back >= self.length:
+			return None
+		turn, xs, ys, hps, owners, tracks, index = self.__slots[(self.__head - turns_back) % self.capacity]
+		i = index.get(track_id)
+		if i is None:
+			return None
+		return (xs[i], ys[i])
+
+
+	def vector(self, track_id, span=HISTORY_SPAN):
+		"""Return how far a tracked robot moved over the last span turns (or as many as are known)."""
+
+		now = self.location(track_id)
+		if now is None:
+			return (0, 0)
+		then = now
+		for back in range(1, span + 1):
+			loc = self.location(track_id, back)
+			if loc is None:
+				break
+			then = loc
+		return (now[0] - then[0], now[1] - then[1])
+
+
+	def __match_foes(self, turn_data, tracks):
+		"""Helper method. Give every enemy of turn_data the track of the enemy it was
+		last turn: the one on its tile, else the only one a step away. Others get new tracks."""
+
+		unmatched = {} # last turn's enemies: location -> (track, hp)
+		if self.length:
+			turn, xs, ys, hps, owners, last_tracks, index = self.__slots[self.__head]
+			for i in range(len(last_tracks)):
+				if owners[i] != turn_data.player_id:
+					unmatched[(xs[i], ys[i])] = (last_tracks[i], hps[i])
+
+		tables = ArenaTables.get()
+		moved = []
+		for foe in turn_data.total_foes:
+			last = unmatched.get(foe.location)
+			if last is not None and last[1] >= foe.hp:
+				tracks[foe.index] = last[0]
+				del unmatched[foe.location]
+			else:
+				moved.append(foe)
+
+		for foe in moved:
+			candidates = [loc for loc in tables.unobstructed_neighbours.get(foe.location, ())
+				if loc in unmatched and unmatched[loc][1] >= foe.hp]
+			if len(candidates) == 1:
+				tracks[foe.index] = unmatched.pop(candidates[0])[0]
+			else:
+				tracks[foe.index] = self.__next_foe_track
+				self.__next_foe_track -= 1
+
+
+	def __predict(self, turn_data):
+		"""Helper method. Expect every enemy that has been moving to keep on along
+		its movement vector's longer axis, onto a tile none of our robots holds."""
+
+		tables = ArenaTables.get()
+		turn, xs, ys, hps, owners, tracks, index = self.__slots[self.__head]
+		self.predicted = {}
+		self.predicted_mask = 0
+		for foe in turn_data.total_foes:
+			dx, dy = self.vector(tracks[foe.index])
+			if not dx and not dy:
+				continue
+			x, y = foe.location
+			if abs(dx) >= abs(dy):
+				tile = (x + (1 if dx > 0 else -1), y)
+			else:
+				tile = (x, y + (1 if dy > 0 else -1))
+			bit = tables.bit(tile)
+			if (tile in tables.unobstructed_neighbours.get(foe.location, ())
+					and not bit & turn_data.friends_mask and tile not in self.predicted):
+				self.predicted[tile] = foe.location
+				self.predicted_mask |= bit
+
+
+	########################################################################
+
+
+class TurnData:
+	"""Collection of data shared by every robot of a player during a turn.
+	Built on the first act() of the turn, then reused by every later call.
+
+	Given the previous turn's TurnData, only what changed since is redone:
+	occupancy, threat counts, quadrant counts and the groups touched by a
+	change are patched from the robots that moved, were hurt, died or
+	appeared. Spawn turns, and turns where more than half the robots
+	changed, are rebuilt from nothing.
+
+	Constructor:
+		TurnData(game, player_id, layout=LAYOUT, previous=None) -> the
+			previous turn's TurnHistory is carried on
+
+	Fields:
+		float started -> Profiler.clock() when the turn's first act() began
+		Game game
+		int turn
+		int player_id
+		tuple layout -> quadrant geometry, as QUADRANT_LAYOUT
+		RobotSnapshot snapshot
+		(RobotView[], RobotView[]) changes -> robots gone and robots new since
+			the previous turn (see RobotSnapshot.diff), None when rebuilt
+		RobotView[] total_friends
+		RobotView[] total_foes
+		RegionStats region_stats
+		Quadrant[] quadrants -> one per entry of the layout, I, II, III, IV by default
+		ThreatMap threat
+		NearestFoeField nearest_foes
+		dict group_ids -> location of each friend to the id of its connected group
+		long[] group_masks -> bitboard of each group, by id
+		int[] group_sizes -> number of robots in each group, by id
+		dict occupancy -> player_id to the bitboard of its robots
+		long robots_mask -> bitboard of every robot
+		long friends_mask
+		long foes_mask
+		long foes_reach_mask -> tiles foes stand on or next to
+		TurnHistory history -> the last turns, this one included
+		dict predicted_moves -> location of a friend to its move this turn
+		Random rng -> the match's random stream
 
-		if quad_num % 2 == 0:
-			self.twin = quad_num - 1
+	Public methods:
+		TurnData for_turn(game, player_id)
+		forget()
+		robotgame-move predict_move(robot)
+		MovePlanner plan()
+		dict actions() -> location to the move of every friendly robot
+		int quadrant_num(location)
+		(int, Location, Location) escape_route(location)"""
+
+	# one snapshot per player, so both sides of a local match can share the module
+	__snapshots = {}
+
+	# built before any robot's stage runs, so it names the turn itself
+	@profiled('TurnData', lambda turn_data, game, player_id, *rest: (game.turn, None, player_id))
+	def __init__(self, game, player_id, layout=None, previous=None):
+
+		self.started = Profiler.clock()
+		self.game = game
+		self.turn = game.turn
+		self.player_id = player_id
+		self.layout = layout or LAYOUT
+
+		self.snapshot = RobotSnapshot(game.robots)
+		self.total_friends = []
+		self.total_foes = []
+		for rob in self.snapshot.views:
+			if rob.player_id == player_id:
+				self.total_friends.append(rob)
+			else:
+				self.total_foes.append(rob)
+
+		self.changes = None
+		if (previous is not None and previous.player_id == player_id and previous.layout is self.layout
+				and (self.turn - 1) % rg.settings.spawn_every != 0):
+			changes = self.snapshot.diff(previous.snapshot)
+			if len(changes[0]) + len(changes[1]) <= len(self.snapshot.views):
+				self.changes = changes
+
+		self.region_stats = RegionStats(self)
+		if self.changes is None:
+			self.__rebuild()
 		else:
-			self.twin = quad_num + 1
+			self.__update(previous)
+
+		self.history = previous.history if previous is not None else TurnHistory()
+		self.history.append(self)
+
+		self.rng = MATCH_RANDOM
+		self.escape_routes = {}
+		self.predicted_moves = {}
+		self.__predicting = set()
+		self.__planner = None
+		self.__actions = None
+
+
+	@classmethod
+	def for_turn(cls, game, player_id):
+		"""Return the snapshot of this turn, building it if this is the first call.
+		Keyed by the game object itself (kept alive by the snapshot) and its turn."""
+
+		snapshot = cls.__snapshots.get(player_id)
+		if snapshot is None or snapshot.game is not game or snapshot.turn != game.turn:
+			snapshot = cls(game, player_id, layout=LAYOUT, previous=snapshot)
+			cls.__snapshots[player_id] = snapshot
+
+		return snapshot
+
+	@classmethod
+	def forget(cls):
+		"""Drop the snapshots kept between turns, so the next turn is built from nothing."""
+
+		cls.__snapshots.clear()
+
+
+	@profiled('predict_move')
+	def predict_move(self, robot):
+		"""Return the move of a friendly robot this turn, computing it only once.
+		A robot whose move is needed while it is itself still deciding (mutual
+		dependency) is assumed to stay put."""
+
+		move = self.predicted_moves.get(robot.location)
+		if move is None:
+			if robot.location in self.__predicting:
+				return ['guard']
+
+			self.__predicting.add(robot.location)
+			try:
+				move = RobotCalculations(robot, self.game).main()
+			finally:
+				self.__predicting.discard(robot.location)
+			self.predicted_moves[robot.location] = move
+
+		return move
+
+
+	def escape_route(self, location):
+		"""Return the (distance, exit, first step) of the nearest way out of the
+		spawn area from location whose exit and first step are free this turn,
+		preferring exits no foe reaches among equally near ones. None if there
+		is none (or location is not a spawn tile)."""
+
+		if location not in self.escape_routes:
+			tables = ArenaTables.get()
+			best = None
+			for distance, exit, steps in tables.spawn_exits.get(location, ()):
+				if tables.bit(exit) & self.robots_mask:
+					continue
+				for step in steps:
+					if not tables.bit(step) & self.robots_mask:
+						key = (distance, bool(tables.bit(exit) & self.foes_reach_mask), exit, step)
+						if best is None or key < best:
+							best = key
+						break
+			self.escape_routes[location] = best and (best[0], best[2], best[3])
+
+		return self.escape_routes[location]
+
+
+	def quadrant_num(self, location):
+		"""Return the number of the quadrant holding location, 0 if none.
+		Quadrants may overlap: the lowest numbered one wins."""
+
+		for num, quad in enumerate(self.quadrants):
+			if quad.contains(location):
+				return num + 1
+		return 0
+
+
+	def plan(self):
+		"""Return the team's moves for this turn, planning them on the first call."""
+
+		if self.__planner is None:
+			self.__planner = MovePlanner(self)
+		return self.__planner
+
+
+	@profiled('actions', lambda turn_data: (turn_data.turn, None, turn_data.player_id))
+	def actions(self):
+		"""Return the move of every friendly robot this turn, by location, deciding them on the first call."""
+
+		if self.__actions is None:
+			planner = self.plan()
+			self.__actions = {}
+			for rob in self.total_friends:
+				move = self.__actions[rob.location] = planner.move_for(rob)
+				if RECORDER is not None:
+					RECORDER.record(self.game, rob, move)
+		return self.__actions
+
+
+	@profiled('TurnData.rebuild')
+	def __rebuild(self):
+		"""Helper method. Compute every turn-wide structure from the robots alone."""
+
+		tables = ArenaTables.get()
+		self.occupancy = {}
+		self.robots_mask = 0
+		for rob in self.snapshot.views:
+			bit = tables.bit(rob.location)
+			self.occupancy[rob.player_id] = self.occupancy.get(rob.player_id, 0) | bit
+			self.robots_mask |= bit
+		self.__mask_sides(tables)
+
+		self.threat = ThreatMap(self)
+		self.nearest_foes = NearestFoeField(self)
+		self.quadrants = [Quadrant(entry, self.region_stats) for entry in self.layout]
+		self.__find_groups(tables, self.friends_mask, [])
+
+
+	@profiled('TurnData.update')
+	def __update(self, previous):
+		"""Helper method. Patch the previous turn's structures with self.changes."""
+
+		tables = ArenaTables.get()
+		removed, added = self.changes
+
+		self.occupancy = previous.occupancy.copy()
+		self.robots_mask = previous.robots_mask
+		for rob in removed:
+			bit = tables.bit(rob.location)
+			self.occupancy[rob.player_id] &= ~bit
+			self.robots_mask &= ~bit
+		for rob in added:
+			bit = tables.bit(rob.location)
+			self.occupancy[rob.player_id] = self.occupancy.get(rob.player_id, 0) | bit
+			self.robots_mask |= bit
+		self.__mask_sides(tables)
+
+		self.threat = ThreatMap(self, previous.threat)
+		if any(rob.player_id != self.player_id for rob in itertools.chain(removed, added)):
+			self.nearest_foes = NearestFoeField(self)
+		else:
+			self.nearest_foes = previous.nearest_foes
+		self.quadrants = [quad.updated(self.player_id, removed, added) for quad in previous.quadrants]
+
+		# groups that lost a robot, or gained one on or next to them, are
+		# flood filled again; the others carry over as they were
+		lost, gained = 0, 0
+		for rob in removed:
+			if rob.player_id == self.player_id:
+				lost |= tables.bit(rob.location)
+		for rob in added:
+			if rob.player_id == self.player_id:
+				gained |= tables.bit(rob.location)
+		touched = lost | tables.expand(gained)
+
+		kept = [group for group in previous.group_masks if not group & touched]
+		remaining = self.friends_mask
+		for group in kept:
+			remaining &= ~group
+		self.__find_groups(tables, remaining, kept)
+
+
+	def __mask_sides(self, tables):
+		"""Helper method. Derive the friend and foe bitboards from the occupancy."""
+
+		self.friends_mask = self.occupancy.get(self.player_id, 0)
+		self.foes_mask = self.robots_mask & ~self.friends_mask
+		self.foes_reach_mask = tables.expand(self.foes_mask)
+
+
+	def __find_groups(self, tables, remaining, groups):
+		"""Helper method. Label the connected groups of friends: flood fill the
+		friends bitboard from each robot of remaining, add those groups to the
+		already known ones, then number them all by their lowest tile."""
+
+		while remaining:
+			group = remaining & -remaining
+			while True:
+				grown = tables.expand(group) & self.friends_mask
+				if grown == group:
+					break
+				group = grown
+
+			groups.append(group)
+			remaining &= ~group
+
+		groups.sort(key=lambda group: group & -group)
+		self.group_ids = {}
+		self.group_masks = groups
+		self.group_sizes = []
+		for group_id, group in enumerate(groups):
+			locs = tables.locations(group)
+			for loc in locs:
+				self.group_ids[loc] = group_id
+			self.group_sizes.append(len(locs))
 
 
 	########################################################################
@@ -81,6 +1529,8 @@ class Quadrant:
 
 class ArenaData:
 	"""Collection of data the robot constructs and queries each turn.
+	Turn-wide data comes from the shared TurnData; only what depends on the
+	robot's own location is computed here.
 	
 	Constructor:
 		ArenaData(robot, game)
@@ -88,16 +1538,18 @@ class ArenaData:
 	Fields:
 		Game game
 		Robot robot
-		Robot[] total_friends
-		Robot[] total_foes
-		Robot[] group
-		Quadrant[] quadrants: I, II, III, IV
+		TurnData turn_data
+		RobotView[] total_friends
+		RobotView[] total_foes
+		int group_id -> -1 if not a friend
+		int group_size -> robots in its connected group, itself included
+		Quadrant[] quadrants
 		int current_quad_num
 		int regroup_quad_num
 	
 	Public methods:
-		Robot[] get_quad_friends()
-		Robot[] get_quad_foes()
+		int get_quad_friends()
+		int get_quad_foes()
 		int get_twin()
 		Quadrant get_quadrant(quad_num)
 		Quadrant get_current_quadrant()
@@ -106,37 +1558,40 @@ class ArenaData:
 		boolean quadrant_inferiority()"""
 
 
-	def __init__(self, robot, game, local_data):
+	def __init__(self, robot, game):
 		
 		self.robot = robot
 		self.game = game
 
-		self.total_friends = []
-		self.total_foes = []
-		self.__index_bots()
-
+		self.turn_data = TurnData.for_turn(game, robot.player_id)
+		self.total_friends = self.turn_data.total_friends
+		self.total_foes = self.turn_data.total_foes
+		self.quadrants = self.turn_data.quadrants
 
-		self.quadrants = [Quadrant(1, self), Quadrant(2, self), Quadrant(3, self), Quadrant(4, self)]
+		self.current_quad_num = self.turn_data.quadrant_num(robot.location)
 
-		self.current_quad_num = self.__find_quad()
-
-		self.group = []
-		self.__find_group(self.robot, self.group, [], local_data)
+		self.group_id = self.turn_data.group_ids.get(robot.location, -1)
+		if self.group_id < 0:
+			self.group_size = 0
+		else:
+			self.group_size = self.turn_data.group_sizes[self.group_id]
 
 		self.regroup_quad_num = self.__find_regroup_quad()
 
 
 	def __find_regroup_quad(self):
 
-		if len(self.get_current_quadrant().quad_foes) == 0:
+		current = self.get_current_quadrant()
+		if current.foe_count == 0:
 			this_quad_ratio = 0
 		else:
-			this_quad_ratio = len(self.get_current_quadrant().quad_friends) / len(self.get_current_quadrant().quad_foes)
+			this_quad_ratio = current.friend_count // current.foe_count
 		
-		if len(self.get_quadrant(self.get_twin()).quad_foes) == 0:
+		twin = self.get_quadrant(self.get_twin())
+		if twin.foe_count == 0:
 			twin_quad_ratio = 0
 		else:
-			twin_quad_ratio = len(self.get_quadrant(self.get_twin()).quad_friends) / len(self.get_quadrant(self.get_twin()).quad_foes)
+			twin_quad_ratio = twin.friend_count // twin.foe_count
 
 		# if this quad less friendly than twin quad
 		if this_quad_ratio < twin_quad_ratio:
@@ -146,49 +1601,11 @@ class ArenaData:
 
 
 
-	def __find_group(self, robot, group, visited, local_data):
-		"""Helper method. Finds coherent group robot is attached to, if exists"""
-
-		# find immediate friends
-		for friendly_robot in local_data.friends_around(robot.location, robot.player_id, robot.location):
-			if not friendly_robot in group:
-				group.append(friendly_robot)
-
-
-		# recursively iterate through the others
-		visited.append(robot)
-		for rob in group:
-			if not rob in visited:
-				self.__find_group(rob, group, visited, local_data)
-
-
-	def __index_bots(self):
-		"""Helper method. Index all robots by friend and foe."""
-
-		for loc, rob in self.game.robots.items():
-			#print robot
-			if rob.player_id == self.robot.player_id:
-				self.total_friends.append(rob)
-			else:
-				self.total_foes.append(rob)
-
-	def __find_quad(self):
-		"""Helper method. Find which quadrant the robot belongs to."""
-
-		for num in range(1,5):
-			for other_robot in self.get_quadrant(num).quad_friends:
-				if self.robot.location == other_robot.location:
-					return num
-		
-		#print "Severe error: bot not found!"
-		return 0
-
-
 	def get_quad_friends(self):
-		return self.quadrants[self.current_quad_num-1].quad_friends
+		return self.quadrants[self.current_quad_num-1].friend_count
 
 	def get_quad_foes(self):
-		return self.quadrants[self.current_quad_num-1].quad_foes
+		return self.quadrants[self.current_quad_num-1].foe_count
 
 	def get_twin(self):
 		return self.quadrants[self.current_quad_num-1].twin
@@ -204,48 +1621,29 @@ class ArenaData:
 
 	def find_closest_foe(self):
 		""""Finds enemy robot closest to location of given robot and returns its location.
-		Breaks ties by lowest HP. Assumes there are enemies remaining"""
-
-		closest_robots = []
-		if self.total_foes:
-			closest_robot = self.total_foes[0] # take any robot to start out
-			for rob in self.total_foes:
-				current_dist = rg.wdist(self.robot.location, rob.location)
-				if current_dist < rg.wdist(self.robot.location, closest_robot.location):
-					closest_robot = rob
-
-			# make list of closest robots (may include more than one)
-
-			for rob in self.total_foes:
-				current_dist = rg.wdist(self.robot.location, rob.location)
-				if current_dist == rg.wdist(self.robot.location, closest_robot.location):
-					closest_robots.append(rob)
-			
-			# break ties with lowest HP if more than one closest robot
-
-			if len(closest_robots) > 1:
-				lowest_HP_rob = closest_robots[0]
-				for rob in closest_robots:
-					if rob.hp < lowest_HP_rob.hp:
-						lowest_HP_rob = rob
+		Distance is walking distance around walls. Breaks ties by lowest HP.
+		Returns None if there are no enemies remaining"""
 
-				return lowest_HP_rob.location
-
-			else: # only one robot, pick him
-				return closest_robots[0].location
+		closest = self.turn_data.nearest_foes.nearest(self.robot.location)
+		if closest is None and self.total_foes:
+			# cut off from every enemy: fall back on distance as the crow walks
+			closest = min(self.total_foes, key=lambda rob: (rg.wdist(self.robot.location, rob.location), rob.hp)).location
+		return closest
 
 	def quadrant_inferiority(self):
 		"""Returns true if the number of enemies is significantly greater than the number of friends, or, if there are
 		few friends, if the number of enemies is >= to #friends."""
-		#print "quad friend #: " + str(len(self.get_quad_friends())) + " and quad foe #: " + str(len(self.get_quad_foes()))
-		return len(self.get_quad_friends()) * 1.5 < len(self.get_quad_foes()) or (
-			len(self.get_quad_friends()) < 2 and len(self.get_quad_foes()) >= len(self.get_quad_friends()))
+		#print "quad friend #: " + str(self.get_quad_friends()) + " and quad foe #: " + str(self.get_quad_foes())
+		return self.get_quad_friends() * PARAMS.quadrant_ratio < self.get_quad_foes() or (
+			self.get_quad_friends() < PARAMS.quadrant_min_friends and self.get_quad_foes() >= self.get_quad_friends())
 
 
 	########################################################################
 
-class LocalData:
+class LocalData(object):
 	"""Collection of data about the immediate surroundings of the robot.
+	The neighbourhood lists are computed on first access, so a robot only
+	pays for the ones its decision path reads.
 
 	Fields:
 		Robot robot
@@ -254,7 +1652,9 @@ class LocalData:
 		Location[] unobstructed_locs -> no friends or enemies in it
 		Location[] normal_unobstructed_locs -> unobstructed + not spawn
 		Location[] safe_locs	-> unobstructed + no enemies around it
-		string[] current_loc_types
+		ArenaTables tables
+		TurnData turn_data
+		int current_tile_type -> TILE_* bitmask
 		Robot[] immediate_friends
 		Robot[] immediate_enemies
 
@@ -268,59 +1668,65 @@ class LocalData:
 
 		self.robot = robot
 		self.game = game
-		self.current_loc_types = rg.loc_types(robot.location)
 
-		self.unobstructed_locs = []
-		self.normal_unobstructed_locs = []
-		self.safe_locs = []
+		self.tables = ArenaTables.get()
+		self.turn_data = TurnData.for_turn(game, robot.player_id)
+		self.current_tile_type = self.tables.tile_type(robot.location)
 
-		self.immediate_friends = []
-		self.immediate_enemies = []
-		
-		valid_and_wall_locs = rg.locs_around(robot.location, filter_out='invalid')
-
-		self.valid_locs = []
-		for vwloc in valid_and_wall_locs:
-			if not 'obstacle' in rg.loc_types(vwloc):
- 				self.unobstructed_locs.append(vwloc)
- 				self.valid_locs.append(vwloc)
- 			elif vwloc in self.game.robots:
- 				# valid locs INCLUDES robots
- 				self.valid_locs.append(vwloc)
- 
-		self.immediate_enemies = self.enemies_around(self.robot.location, self.robot.player_id)
-		self.immediate_friends = self.friends_around(self.robot.location, self.robot.player_id, self.robot.location)
-
- 		for unobloc in self.unobstructed_locs:
- 			if not 'spawn' in rg.loc_types(unobloc):
- 				self.normal_unobstructed_locs.append(unobloc)
-
- 			if not self.enemies_around(unobloc, robot.player_id):
-				self.safe_locs.append(unobloc)
-
-		#print self.normal_unobstructed_locs
-			
 
-	def enemies_around(self, location, player_id, bot_loc = (0,0)):
-		"""Returns list of enemies around that tile."""
+	# the static neighbour tuples are shared, never copied
+
+	@lazy
+	def unobstructed_locs(self):
+		return self.tables.unobstructed_neighbours.get(self.robot.location, ())
 
-		actual_enemies = []
-		potential_enemies = self.valid_locs
+	@lazy
+	def normal_unobstructed_locs(self):
+		return self.tables.normal_neighbours.get(self.robot.location, ())
 
-		if potential_enemies:
-			for loc, bot in self.game.robots.iteritems():
-				if bot.player_id != player_id and bot_loc != loc:
-					if rg.wdist(loc, location) <= 1:
-						actual_enemies.append(bot)
+	@lazy
+	def valid_locs(self):
+		# valid locs INCLUDES robots
+		walls = self.tables.wall_neighbours.get(self.robot.location, ())
+		if not walls:
+			return self.unobstructed_locs
+		return self.unobstructed_locs + tuple(loc for loc in walls if self.tables.bit(loc) & self.turn_data.robots_mask)
 
-		return actual_enemies
+	@lazy
+	def immediate_enemies(self):
+		return self.enemies_around(self.robot.location, self.robot.player_id)
+
+	@lazy
+	def immediate_friends(self):
+		return self.friends_around(self.robot.location, self.robot.player_id, self.robot.location)
+
+	@lazy
+	def safe_locs(self):
+		# safe: no enemy on or next to it
+		return [loc for loc in self.unobstructed_locs
+			if not self.tables.bit(loc) & self.turn_data.foes_reach_mask]
+
+
+	@profiled('enemies_around')
+	def enemies_around(self, location, player_id, bot_loc = (0,0)):
+		"""Returns list of enemies around that tile."""
+
+		enemies_mask = self.turn_data.robots_mask & ~self.turn_data.occupancy.get(player_id, 0)
+		return self.__robots_around(enemies_mask, location, bot_loc)
 
 	def friends_around(self, location, player_id, bot_loc):
 		"""Return list of friends around that tile."""
 
-		for loc in self.game.robots:
-			if self.game.robots[loc].player_id != player_id:
-				return self.enemies_around(location, self.game.robots[loc].player_id, bot_loc)
+		return self.__robots_around(self.turn_data.occupancy.get(player_id, 0), location, bot_loc)
+
+	def __robots_around(self, mask, location, bot_loc):
+		"""Helper method. Robots of mask on or next to location, bot_loc excluded."""
+
+		if not self.valid_locs:
+			return []
+
+		mask &= self.tables.area_mask(location) & ~self.tables.bit(bot_loc)
+		return [self.turn_data.snapshot.robot_at(loc) for loc in self.tables.locations(mask)]
 
 	def least_dangerous_nonsafe_locs(self):
 		"""Returns 'least dangerous' (less enemies around) non-safe locations to move to.
@@ -330,7 +1736,7 @@ class LocalData:
 		least_enemies_num = 5 # impossibly high
 
 		for loc in self.unobstructed_locs:
-			num_enemies = len(self.enemies_around(loc, self.robot.player_id))
+			num_enemies = self.turn_data.threat.enemy_count(loc)
 			if least_enemies_num >= num_enemies:
 				least_dangerous_locs.append(loc)
 				least_enemies_num = num_enemies
@@ -338,44 +1744,545 @@ class LocalData:
 		return least_dangerous_locs
 
 	def safe_locs_non_spawn(self):
-		return [loc for loc in self.safe_locs if 'spawn' not in rg.loc_types(loc)]
+		return [loc for loc in self.tables.normal_neighbours.get(self.robot.location, ())
+			if not self.tables.bit(loc) & self.turn_data.foes_reach_mask]
+
+
+	########################################################################
+
+class LocalSearch:
+	"""Anytime lookahead over one robot's neighbourhood: its own moves against
+	the likely replies of the enemies around it, deepened one turn at a time
+	until LOOKAHEAD_MAX_DEPTH or the deadline. Only fully searched depths count.
+
+	The model is small on purpose. Friends stay where they are. Enemies
+	either press (those next to the robot attack it, the others step towards
+	it) or hold (those next to it guard, the others stay), whichever is worse
+	for us. Attacks do the average roll, halved on a guard; suicides and
+	spawn turns follow rg.settings. A turn is worth the damage dealt minus
+	the damage taken, with a robot's full HP as the bonus or cost of a kill
+	or a death.
+
+	Constructor:
+		LocalSearch(turn_data, robot, deadline)
+
+	Fields:
+		int depth -> deepest fully searched depth, 0 if none
+		dict values -> each root move (as a tuple) to its value at that depth
+
+	Public methods:
+		robotgame-move improve(move)"""
+
+	@profiled('LocalSearch')
+	def __init__(self, turn_data, robot, deadline):
+
+		self.turn_data = turn_data
+		self.tables = ArenaTables.get()
+		self.deadline = deadline
+		self.turn = turn_data.turn
+		self.avg_attack = turn_data.threat.avg_attack
+		self.kill_value = rg.settings.robot_hp
+		self.blocked = turn_data.friends_mask & ~self.tables.bit(robot.location)
+		self.__steps = {}
+
+		by_distance = sorted((rg.wdist(foe.location, robot.location), foe.location, foe.hp) for foe in turn_data.total_foes)
+
+		self.depth = 0
+		self.values = {}
+		for depth in range(1, LOOKAHEAD_MAX_DEPTH + 1):
+			# enemies further than one step past the horizon can never reach us
+			foes = tuple(sorted((loc, hp) for dist, loc, hp in by_distance if dist <= depth + 1))
+			self.__memo = {}
+			try:
+				values = dict((action, self.__action_value(robot.location, robot.hp, foes, action, depth, 0))
+					for action in self.__actions(robot.location, foes))
+			except LocalSearch.Timeout:
+				break
+			self.depth, self.values = depth, values
+
+
+	class Timeout(Exception):
+		pass
+
+
+	def improve(self, move):
+		"""Return the best searched move if it beats move by at least a kill
+		or a death (the model is too rough to trust on smaller margins), else move."""
+
+		if not self.depth:
+			return move
+
+		current = self.values.get(tuple(move))
+		if current is None:
+			return move
+		best = max(sorted(self.values), key=lambda action: self.values[action])
+		if self.values[best] - current >= self.kill_value:
+			return list(best)
+		return move
+
+
+	def __actions(self, location, foes):
+		"""Helper method. Every action worth considering from location."""
+
+		foe_locs = set(loc for loc, hp in foes)
+		actions = [('guard',)]
+		for loc in self.tables.unobstructed_neighbours[location]:
+			actions.append(('attack', loc))
+		for loc in self.__free_steps(location):
+			if loc not in foe_locs:
+				actions.append(('move', loc))
+		if any(rg.wdist(loc, location) == 1 for loc in foe_locs):
+			actions.append(('suicide',))
+		return actions
+
+
+	def __free_steps(self, location):
+		"""Helper method. Tiles around location that are neither walls nor friends."""
+
+		steps = self.__steps.get(location)
+		if steps is None:
+			steps = self.__steps[location] = tuple(loc for loc in self.tables.unobstructed_neighbours[location]
+				if not self.tables.bit(loc) & self.blocked)
+		return steps
+
+
+	def __value(self, location, hp, foes, depth, ply):
+		"""Helper method. Best value of the position over depth more turns."""
+
+		if depth == 0:
+			return 0
+		key = (location, hp, foes, depth)
+		value = self.__memo.get(key)
+		if value is None:
+			if Profiler.clock() > self.deadline:
+				raise LocalSearch.Timeout()
+			value = max(self.__action_value(location, hp, foes, action, depth, ply)
+				for action in self.__actions(location, foes))
+			self.__memo[key] = value
+		return value
+
+
+	def __action_value(self, location, hp, foes, action, depth, ply):
+		"""Helper method. Value of action against the worst reply of the enemies."""
+
+		return min(self.__reply_value(location, hp, foes, action, pressing, depth, ply)
+			for pressing in (True, False))
+
+
+	def __reply_value(self, location, hp, foes, action, pressing, depth, ply):
+		"""Helper method. Play one turn: action against the adjacent enemies
+		attacking (pressing) or guarding, the others stepping closer."""
+
+		dest = action[1] if action[0] == 'move' else location
+		guarding = action[0] == 'guard'
+		dx, dy = dest
+
+		# enemies move first
+		taken = set(loc for loc, foe_hp in foes)
+		moved = []
+		attackers = 0
+		for loc, foe_hp in foes:
+			dist = abs(loc[0] - dx) + abs(loc[1] - dy)
+			if dist == 1 or not pressing:
+				attackers += pressing
+				moved.append((loc, foe_hp, dist == 1 and not pressing))
+				continue
+			step = loc
+			for nloc in self.__free_steps(loc):
+				ndist = abs(nloc[0] - dx) + abs(nloc[1] - dy)
+				if ndist < dist and ndist > 0 and nloc not in taken:
+					step, dist = nloc, ndist
+			taken.discard(loc)
+			taken.add(step)
+			moved.append((step, foe_hp, False))
+
+		# then damage
+		value = 0
+		survivors = []
+		for loc, foe_hp, foe_guarding in moved:
+			damage = 0
+			if action[0] == 'attack' and loc == action[1]:
+				damage = self.avg_attack
+			elif action[0] == 'suicide' and rg.wdist(loc, location) == 1:
+				damage = rg.settings.suicide_damage
+			if foe_guarding:
+				damage //= 2
+			value += min(damage, foe_hp)
+			if damage >= foe_hp:
+				value += self.kill_value
+			else:
+				survivors.append((loc, foe_hp - damage))
+
+		damage = attackers * self.avg_attack
+		if guarding:
+			damage //= 2
+		spawning = (self.turn + ply) % rg.settings.spawn_every == 0 and self.tables.tile_type(dest) & TILE_SPAWN
+		if action[0] == 'suicide' or spawning or damage >= hp:
+			return value - hp - self.kill_value
+
+		value -= damage
+		return value + self.__value(dest, hp - damage, tuple(sorted(survivors)), depth - 1, ply + 1)
+
+
+	########################################################################
+
+
+class MovePlanner:
+	"""Plans the moves of every friendly robot of a turn at once.
+	Each robot proposes a move through its stances (TurnData.predict_move),
+	then collisions between friends are resolved centrally: contested tiles,
+	swaps, cycles, and moves into friends that stay put.
+
+	With time left before the turn's lookahead deadline, robots within reach
+	of an enemy (most endangered first) run a LocalSearch, which replaces
+	their stance's move only when it finds a clearly better one.
+
+	Constructor:
+		MovePlanner(turn_data)
+
+	Fields:
+		TurnData turn_data
+		dict proposals -> location to the move proposed by the robot there
+		dict moves -> location to the move the robot there will make
+
+	Public methods:
+		robotgame-move move_for(robot)"""
+
+	@profiled('MovePlanner')
+	def __init__(self, turn_data):
+
+		self.turn_data = turn_data
+		self.tables = ArenaTables.get()
+
+		self.proposals = {}
+		for loc in sorted(rob.location for rob in turn_data.total_friends):
+			self.proposals[loc] = self.__normalize(loc, turn_data.predict_move(turn_data.snapshot.robot_at(loc)))
+
+		self.moves = dict(self.proposals)
+		if LOOKAHEAD_DEADLINE > 0:
+			self.__look_ahead(turn_data.started + LOOKAHEAD_DEADLINE)
+		self.__resolve()
+
+
+	def __look_ahead(self, deadline):
+		"""Helper method. Let LocalSearch improve the moves of robots near enemies until the deadline."""
+
+		near_foes = self.tables.expand(self.turn_data.foes_reach_mask)
+		for loc in sorted(self.moves, key=self.__priority):
+			if not self.tables.bit(loc) & near_foes:
+				continue
+			if Profiler.clock() > deadline:
+				break
+			search = LocalSearch(self.turn_data, self.turn_data.snapshot.robot_at(loc), deadline)
+			self.moves[loc] = self.__normalize(loc, search.improve(self.moves[loc]))
+
+
+	def move_for(self, robot):
+		"""Return the planned move of a robot (planning it alone if it was not known)."""
+
+		move = self.moves.get(robot.location)
+		if move is None:
+			move = self.__normalize(robot.location, self.turn_data.predict_move(robot))
+		return move
+
+
+	def __normalize(self, location, move):
+		"""Helper method. Prevent moves and attacks to one's own tile."""
+
+		if location in move:
+			#print "Moving to itself... fix before it gets here!"
+			return ['guard']
+		return move
+
+
+	def __priority(self, location):
+		"""Helper method. Sort key: robots in the most danger, then the weakest, move first."""
+
+		return (-self.turn_data.threat.damage(location), self.turn_data.snapshot.robot_at(location).hp, location)
+
+
+	def __fallback(self, location):
+		"""Helper method. What a robot does instead of a cancelled move: hit the
+		weakest adjacent enemy, else guard."""
+
+		foes = self.tables.locations(self.tables.area_mask(location) & self.turn_data.foes_mask)
+		if foes:
+			return ['attack', min(foes, key=lambda loc: self.turn_data.snapshot.robot_at(loc).hp)]
+		return ['guard']
+
+
+	def __target(self, location):
+		"""Helper method. Tile a robot is moving to, None if it stays."""
+
+		move = self.moves[location]
+		if move[0] == 'move':
+			return move[1]
+		return None
+
+
+	def __resolve(self):
+		"""Helper method. Cancel friendly moves until no two friends can collide."""
+
+		changed = True
+		while changed:
+			changed = False
+
+			# several friends moving to the same tile: the first in priority goes
+			claims = {}
+			for loc in self.moves:
+				target = self.__target(loc)
+				if target is not None:
+					claims.setdefault(target, []).append(loc)
+			for target, locs in claims.items():
+				if len(locs) > 1:
+					locs.sort(key=self.__priority)
+					for loc in locs[1:]:
+						self.moves[loc] = self.__fallback(loc)
+					changed = True
+
+			for loc in sorted(self.moves, key=self.__priority):
+				target = self.__target(loc)
+				if target is None or target not in self.moves:
+					continue
+
+				# moving into a friend that stays
+				if self.__target(target) is None:
+					self.moves[loc] = self.__fallback(loc)
+					changed = True
+					continue
+
+				# swaps and longer cycles: cancel the member that can best afford it
+				cycle = [loc]
+				nxt = target
+				while nxt is not None and nxt in self.moves and nxt not in cycle:
+					cycle.append(nxt)
+					nxt = self.__target(nxt)
+				if nxt == loc:
+					last = max(cycle, key=self.__priority)
+					self.moves[last] = self.__fallback(last)
+					changed = True
+
+
+	########################################################################
+
+
+class PatternCache:
+	"""Bounded LRU cache of stance decisions, keyed by the robot's
+	neighbourhood: its 5x5 window (tile types, friends, foes and weak foes,
+	where flanking is possible, where it is heading), whether it is in
+	lethal danger and the turn's phase relative to spawn_every. Keys are
+	canonicalized under the board's 8 symmetries, moves stored relative to
+	the robot in that canonical frame, so a pattern seen once serves every
+	rotation and reflection of it, in any later turn or match.
+
+	Only decisions that read nothing outside the pattern are stored (see
+	RobotCalculations.cacheable): no random draw, no friend's predicted move,
+	no quadrant counts. Of several symmetric moves, a hit returns the one
+	picked the first time.
+
+	Constructor:
+		PatternCache(size=PATTERN_CACHE_SIZE)
+
+	Fields:
+		int hits
+		int misses
+		int evictions
+		int uncacheable -> decisions not stored, having read outside the pattern
+
+	Public methods:
+		tuple pattern(turn_data, robot, toward_loc)
+		robotgame-move get(pattern, location)
+		put(pattern, location, move)
+		clear()
+		dict stats()"""
+
+	OFFSETS = tuple((dx, dy) for dy in range(-2, 3) for dx in range(-2, 3))
+	STEPS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+
+	# (a, b, c, d) maps an offset (dx, dy) to (a*dx + b*dy, c*dx + d*dy)
+	TRANSFORMS = (
+		(1, 0, 0, 1), (-1, 0, 0, 1), (1, 0, 0, -1), (-1, 0, 0, -1),
+		(0, 1, 1, 0), (0, -1, 1, 0), (0, 1, -1, 0), (0, -1, -1, 0),
+	)
+
+	# window cell codes
+	TILE_CODES = ((TILE_NORMAL, 1), (TILE_SPAWN, 2), (TILE_OBSTACLE, 3))
+	FRIEND, FOE, WEAK_FOE, FLANK, TOWARD = 4, 8, 16, 32, 64
+
+	def __init__(self, size=PATTERN_CACHE_SIZE):
+
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.uncacheable = 0
+
+		def apply(transform, offset):
+			a, b, c, d = transform
+			return (a * offset[0] + b * offset[1], c * offset[0] + d * offset[1])
+
+		# canonical window cell j shows the real cell at transform(OFFSETS[j]);
+		# a real step maps back to the canonical one through the inverse
+		self.__permutations = [operator.itemgetter(*[self.OFFSETS.index(apply(t, offset)) for offset in self.OFFSETS])
+			for t in self.TRANSFORMS]
+		self.__to_real = [dict((step, apply(t, step)) for step in self.STEPS) for t in self.TRANSFORMS]
+		self.__to_canonical = [dict((apply(t, step), step) for step in self.STEPS) for t in self.TRANSFORMS]
+		self.__neighbours = [(self.OFFSETS.index(step), step) for step in self.STEPS[1:]]
+		self.__windows = {}
+
+
+	def pattern(self, turn_data, robot, toward_loc):
+		"""Return the (key, transform) of a robot's situation, None when a friend
+		is two steps away or less: its predicted move would almost always be read."""
+
+		tables = ArenaTables.get()
+		avg_attack = turn_data.threat.avg_attack
+		x, y = robot.location
+
+		tiles, window_mask, reach_mask = self.__window(tables, robot.location)
+		if reach_mask & turn_data.friends_mask:
+			return None
+
+		codes = list(tiles)
+		for loc in tables.locations(window_mask & turn_data.robots_mask):
+			j = (loc[1] - y + 2) * 5 + loc[0] - x + 2
+			if tables.bit(loc) & turn_data.friends_mask:
+				codes[j] |= self.FRIEND
+			elif turn_data.snapshot.robot_at(loc).hp < avg_attack:
+				codes[j] |= self.FOE | self.WEAK_FOE
+			else:
+				codes[j] |= self.FOE
+
+		for j, step in self.__neighbours:
+			if (codes[j] & 3) in (1, 2) and turn_data.threat.can_flank((x + step[0], y + step[1])):
+				codes[j] |= self.FLANK
+		codes[self.OFFSETS.index((toward_loc[0] - x, toward_loc[1] - y))] |= self.TOWARD
+
+		turn, spawn_every = turn_data.turn, rg.settings.spawn_every
+		header = (turn_data.threat.damage(robot.location) > robot.hp * PARAMS.danger_ratio, turn < 3, turn < spawn_every - 1,
+			turn % spawn_every == spawn_every - 1, turn % spawn_every == 0)
+
+		window, transform = min((permute(codes), t) for t, permute in enumerate(self.__permutations))
+		return (header, window), transform
+
+
+	def get(self, pattern, location):
+		"""Return the move stored for pattern, made absolute for a robot at location, None if unknown."""
+
+		key, transform = pattern
+		move = self.entries.get(key)
+		if move is None:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		del self.entries[key]
+		self.entries[key] = move
+		if len(move) == 1:
+			return [move[0]]
+		step = self.__to_real[transform][move[1]]
+		return [move[0], (location[0] + step[0], location[1] + step[1])]
+
+
+	def put(self, pattern, location, move):
+		"""Store a robot's move for pattern, evicting the least recently used entry if full."""
+
+		key, transform = pattern
+		if len(move) > 1:
+			step = self.__to_canonical[transform].get((move[1][0] - location[0], move[1][1] - location[1]))
+			if step is None:
+				return
+			move = (move[0], step)
+		else:
+			move = (move[0],)
+
+		self.entries[key] = move
+		if len(self.entries) > self.size:
+			self.entries.popitem(last=False)
+			self.evictions += 1
+
+
+	def clear(self):
+		self.entries.clear()
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			'size': len(self.entries),
+			'hits': self.hits,
+			'misses': self.misses,
+			'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+			'evictions': self.evictions,
+			'uncacheable': self.uncacheable,
+		}
+
+
+	def __window(self, tables, location):
+		"""Helper method. The tile codes of the 5x5 window around location,
+		the bitboard of its cells on the board, and that of the tiles two
+		steps or less away from it."""
+
+		window = self.__windows.get(location)
+		if window is None:
+			tiles = []
+			mask = 0
+			for dx, dy in self.OFFSETS:
+				loc = (location[0] + dx, location[1] + dy)
+				tile_type = tables.tile_type(loc)
+				tile = 0
+				for bit, code in self.TILE_CODES:
+					if tile_type & bit:
+						tile = code
+				tiles.append(tile)
+				mask |= tables.bit(loc)
+			reach = tables.expand(tables.area_mask(location)) & ~tables.bit(location)
+			window = self.__windows[location] = (tuple(tiles), mask, reach)
+		return window
+
+
+PATTERN_CACHE = PatternCache()
 
 
 	########################################################################
 
 class RobotCalculations:
 	"""Wrapper class around a robot and game, to permit recursion.
+	main() is the per-robot proposal stage of the MovePlanner.
+
+		Fields:
+			boolean cacheable -> False once the stances read anything PatternCache keys do not hold
 
 		Public methods:
 			robotgame-move main()"""
 
-	def __init__(self, robot, game, recursion_count = 0):
-
-		self.recursion_count = recursion_count + 1 
-		self.max_recursive = 2 # only allow one recursive iteration
+	@profiled('RobotCalculations')
+	def __init__(self, robot, game):
 
 		self.robot = robot
 		self.game = game
 		
-		random.seed()
 		self.local_data = LocalData(self.robot, self.game)
-		self.arena_data = ArenaData(self.robot, self.game, self.local_data)
+		self.arena_data = ArenaData(self.robot, self.game)
+		self.rng = self.arena_data.turn_data.rng
+		self.cacheable = True
 
 
 	########################################################################
 
 
+	@profiled('evaluate_direction', robot_calculations_robot)
 	def __evaluate_direction(self):
 		"""Set robot's ultimate direction based on situation of quadrant."""
 
 		# first few turns -> head to center
-		if self.game.turn <= 3:
+		if self.game.turn <= PARAMS.opening_turns:
 		#if self.game.turn % rg.settings.spawn_every <= 3 and self.game.turn % rg.settings.spawn_every != 0:
 			return rg.CENTER_POINT
 		# later game -> context specific
 		else:
 			# if less enemies here than in our twin --> TODO wrapper for twin foes
-			if len(self.arena_data.get_quad_foes() ) < len(self.arena_data.get_quadrant(self.arena_data.get_twin()).quad_foes ):
+			if self.arena_data.get_quad_foes() < self.arena_data.get_quadrant(self.arena_data.get_twin()).foe_count:
 				# get closest enemy and set it as destination
 				#print "going for closest foe at " + str(self.arena_data.find_closest_foe())
 				return self.arena_data.find_closest_foe()
@@ -384,8 +2291,7 @@ class RobotCalculations:
 			# more enemies here than twin -> regroup (in twin)
 			# no enemies -> regroup
 			else:
-				# added minor randomness to help break "traffic jams"
-				return (self.arena_data.get_regroup_point()[0] + random.randint(-1,1) , self.arena_data.get_regroup_point()[1] + random.randint(-1,1))
+				return self.arena_data.get_regroup_point()
 
 
 	########################################################################
@@ -393,6 +2299,35 @@ class RobotCalculations:
 	# set of LOCAL STANCE METHODS which return a move
 	# TODO put reused code in seperate methods
 
+	def __step_toward(self, destination):
+		"""Next tile towards destination around walls, stepping around friends
+		where an equally short way exists (that is what breaks "traffic jams")."""
+
+		if destination is None:
+			return self.robot.location
+		return self.local_data.tables.step_toward(self.robot.location, destination,
+			self.arena_data.turn_data.friends_mask)
+
+
+	########################################################################
+
+	# inputs from outside the robot's pattern: reading them makes the decision uncacheable
+
+	def __choice(self, options):
+		self.cacheable = False
+		return self.rng.choice(options)
+
+	def __friend_move(self, friend):
+		self.cacheable = False
+		return self.arena_data.turn_data.predict_move(friend)
+
+	def __quadrant_inferiority(self):
+		self.cacheable = False
+		return self.arena_data.quadrant_inferiority()
+
+
+	########################################################################
+
 	def __endangered_stance(self):
 		"""Attack neighbouring enemies if they exist, else guard.
 		
@@ -409,6 +2344,7 @@ class RobotCalculations:
 		else:
 			return ['guard']
 
+	@profiled('cautious_stance', robot_calculations_robot)
 	def __cautious_stance(self, towards, recursive = False):
 		"""Attacks neighbours, then tries to help friends, otherwise attacks towards.
 		
@@ -422,10 +2358,10 @@ class RobotCalculations:
 		# not random for now, maybe fix later
 		if not recursive:
 			if self.robot.location == towards:
-				for loc, bot in self.arena_data.game.robots.iteritems():
-					if bot.player_id != self.robot.player_id:
-						if rg.dist(loc, self.robot.location) <= 3:
-							return self.__aggressive_stance(rg.toward(self.robot.location, loc), recursive=True)
+				self.cacheable = False
+				for bot in self.arena_data.total_foes:
+					if rg.dist(bot.location, self.robot.location) <= PARAMS.chase_distance:
+						return self.__aggressive_stance(self.__step_toward(bot.location), recursive=True)
 
 			# help adjacent allies as second priority
 			for loc in self.local_data.unobstructed_locs:
@@ -441,9 +2377,15 @@ class RobotCalculations:
 			if possible_attack:
 				return possible_attack
 
-		# attack possible enemy move locations
+		# attack possible enemy move locations, first where the history expects one
+		history = self.arena_data.turn_data.history
+		if self.local_data.tables.area_mask(self.robot.location) & history.predicted_mask:
+			for loc in self.local_data.unobstructed_locs:
+				if loc in history.predicted:
+					return ['attack', loc]
 		return ['attack', towards]
 
+	@profiled('passive_stance', robot_calculations_robot)
 	def __passive_stance(self, towards, recursive=False):
 		"""Ignores neighbours, otherwise moves to towards.
 		
@@ -456,12 +2398,11 @@ class RobotCalculations:
 		# move to towards if safe, else move to other safe, else move into friend
 		if self.local_data.safe_locs:
 			if not towards in self.local_data.safe_locs:
-				towards = random.choice(self.local_data.safe_locs)
+				towards = self.__choice(self.local_data.safe_locs)
 
 		elif self.local_data.immediate_friends:
 			for f in self.local_data.immediate_friends:							
-				rec_robo_calc = RobotCalculations(f, self.game, self.recursion_count)
-				fmove = rec_robo_calc.main()
+				fmove = self.__friend_move(f)
 				if 'move' in fmove:
 					towards = f.location
 		else:
@@ -473,7 +2414,7 @@ class RobotCalculations:
 			# make sure we're not running into a friendly
 			#print "checking friendly running into me..."
 			if self.__friendly_running_into_me(towards):
-				if self.local_data.safe_locs > 1:
+				if len(self.local_data.safe_locs) > 1:
 					for sloc in self.local_data.safe_locs:
 						if sloc != towards:
 							#print "recursion check"
@@ -483,6 +2424,7 @@ class RobotCalculations:
 
 		return ['move', towards]
 
+	@profiled('aggressive_stance', robot_calculations_robot)
 	def __aggressive_stance(self, towards, recursive=False):
 		"""Attacks neighbours, then tries to help friends, otherwise moves to towards.
 		
@@ -509,7 +2451,7 @@ class RobotCalculations:
 
 			# make sure we're not running into a friendly
 			if self.__friendly_running_into_me(towards):
-				if self.local_data.safe_locs > 1:
+				if len(self.local_data.safe_locs) > 1:
 					for sloc in self.local_data.safe_locs:
 						if sloc != towards:
 							#print str(sloc)
@@ -542,22 +2484,19 @@ class RobotCalculations:
 
 	# helpers
 
-	def __avg_attack(self):
-		"""Return the average attack value of a bot attack."""
-		return (rg.settings.attack_range[0] + rg.settings.attack_range[1])/2
-
 	def __attack_if_beside(self, robot):
 		"""Attack an adjacent location if an enemy is present."""
 
 		#TODO : randomize
 
 		#hostiles = False
-		for loc, bot in self.game.robots.iteritems():
-			if bot.player_id != robot.player_id:
-				if rg.dist(loc, robot.location) <= 1:
-					#hostiles = True
-					#if bot.hp > (local_data.immediate_enemies()-1) * avg_attack():
-					return ['attack', loc]
+		turn_data = self.arena_data.turn_data
+		tables = self.local_data.tables
+		enemies_mask = turn_data.robots_mask & ~turn_data.occupancy.get(robot.player_id, 0)
+		for loc in tables.locations(enemies_mask & tables.area_mask(robot.location)):
+			#hostiles = True
+			#if bot.hp > (local_data.immediate_enemies()-1) * avg_attack():
+			return ['attack', loc]
 
 
 		# flee if not worth time to kill anything / might be suicide
@@ -568,45 +2507,26 @@ class RobotCalculations:
 		#			return ['move', adj_loc]
 
 
+	@profiled('can_flank_enemy_safely', robot_calculations_robot)
 	def __can_flank_enemy_safely(self, location):
-		"""Look for enemies that are beside friends, whom we can flank. If so, output True."""
-
-		if location in self.game.robots:
-			return False
-
-		enemy_count = 0
-		enemies_low_HP = 0
-		# all true enemies must be "busy" in order to move in	
+		"""Look for enemies that are beside friends, whom we can flank. If so, output True.
+		All true enemies must be "busy" in order to move in; if they all have low HP
+		it is not worth the flank, AND might be a suicide."""
 
-		for loc, bot in self.arena_data.game.robots.iteritems():
-			if bot.player_id != self.arena_data.robot.player_id:
-				if rg.wdist(loc, location) <= 1:
-					enemy_count += 1
-					if bot.hp < self.__avg_attack():
-						enemies_low_HP += 1
-					if not self.__attack_if_beside(bot):
-						return False
-
-		#if enemy_count:
-			#print "bot #" + str(robot.robot_id) + " " + str(enemy_count) + " and all enemies busy"
-
-		# 0 -> false -> no enemies to flank
-		# if all enemies have low HP -> not worth the flank, AND might be a suicide
-		return enemy_count > 0 and enemy_count != enemies_low_HP
+		return self.arena_data.turn_data.threat.can_flank(location)
 
 
+	@profiled('friendly_running_into_me', robot_calculations_robot)
 	def __friendly_running_into_me(self, move_loc):
 		"""Avoid wasting a turn running into a friendly.
 		Returns true if a friendly has been predicted to be entering that location."""
 
-		if self.recursion_count < self.max_recursive:
-			for friend in self.local_data.friends_around(move_loc, self.robot.player_id, self.robot.location):
-				#print "there is a friend around"
-				rec_robo_calc = RobotCalculations(friend, self.game, self.recursion_count)
-				if move_loc in rec_robo_calc.main():
-					#print "friendlies running into me"
-					#traceback.#print_stack(file=sys.stdout)
-					return True
+		for friend in self.local_data.friends_around(move_loc, self.robot.player_id, self.robot.location):
+			#print "there is a friend around"
+			if move_loc in self.__friend_move(friend):
+				#print "friendlies running into me"
+				#traceback.#print_stack(file=sys.stdout)
+				return True
 
 		return False
 
@@ -614,57 +2534,83 @@ class RobotCalculations:
 
 	#TODO refactor main() into smaller components
 
+	@profiled('main', robot_calculations_robot)
 	def main(self):
-		"""Evaluate direction and pick a stance."""
+		"""Evaluate direction and pick a stance, unless the same pattern
+		already has a stance's move in the PatternCache."""
 
 		# pick direction (macro-scale)
 		
 		direction = self.__evaluate_direction()
-		toward_loc = rg.toward(self.robot.location, direction)
+		toward_loc = self.__step_toward(direction)
 		
 		#print "destination :  " + str(direction) + " and predicted next move: " + str(toward_loc)
 
+		# predicted enemy steps are not part of the pattern
+		pattern = None
+		if not self.local_data.tables.area_mask(self.robot.location) & self.arena_data.turn_data.history.predicted_mask:
+			pattern = PATTERN_CACHE.pattern(self.arena_data.turn_data, self.robot, toward_loc)
+		if pattern is None:
+			PATTERN_CACHE.uncacheable += 1
+			return self.__pick_stance(toward_loc)
+
+		move = PATTERN_CACHE.get(pattern, self.robot.location)
+		if move is None:
+			move = self.__pick_stance(toward_loc)
+			if self.cacheable:
+				PATTERN_CACHE.put(pattern, self.robot.location, move)
+			else:
+				PATTERN_CACHE.uncacheable += 1
+		return move
+
 
-		# pick stance (micro-scale)
+	def __pick_stance(self, toward_loc):
+		"""Helper method. Pick a stance (micro-scale) and return its move."""
 
 		# extreme failure case
-		if 'invalid' in self.local_data.current_loc_types:
+		if self.local_data.current_tile_type & TILE_INVALID:
 			#print "Robot on invalid tile; impossible!"
 			return ['suicide']
 		#if you're likely to die surrouded by enemies attacking you -> run or suicide
-		elif len(self.local_data.immediate_enemies) * (self.__avg_attack()+rg.settings.attack_range[0])/2  > self.robot.hp:
+		elif self.arena_data.turn_data.threat.damage(self.robot.location) > self.robot.hp * PARAMS.danger_ratio:
 			if self.local_data.safe_locs:
 				return self.__passive_stance(toward_loc)
 			else:
 				return ['suicide']
 
 		# if early game spawn
-		elif 'spawn' in self.local_data.current_loc_types and self.game.turn < rg.settings.spawn_every-1:
+		elif self.local_data.current_tile_type & TILE_SPAWN and self.game.turn < rg.settings.spawn_every-1:
 		
 			#get out passively if we can
 			return self.__passive_stance(toward_loc)
 					
 
 		# normal location or rg.settings.spawn_every-1 turns after start in a spawn location
-		if 'normal' in self.local_data.current_loc_types or ('spawn' in self.local_data.current_loc_types and self.game.turn >= rg.settings.spawn_every-1):
+		if self.local_data.current_tile_type & TILE_NORMAL or (self.local_data.current_tile_type & TILE_SPAWN and self.game.turn >= rg.settings.spawn_every-1):
 			
 			# 'emergency evacuation of spawn' cases
-			if 'spawn' in self.local_data.current_loc_types:
+			if self.local_data.current_tile_type & TILE_SPAWN:
 				# in two turns it will be destroyed
 				# check that next turn it can leave to a 'normal' location
 				if self.game.turn % rg.settings.spawn_every == rg.settings.spawn_every - 1:
 					# can't move anywhere
 					if not self.local_data.unobstructed_locs: 
 						return self.__endangered_stance()
-					# can't move to non-spawn
+					# can't move to non-spawn: head for a free exit we can reach in time
 					elif not self.local_data.normal_unobstructed_locs: 
+						route = self.arena_data.turn_data.escape_route(self.robot.location)
+						if route is not None and route[0] <= 2:
+							if route[2] in self.local_data.safe_locs:
+								return self.__passive_stance(route[2])
+							return ['move', route[2]]
+
 						if not self.local_data.safe_locs:
 							if toward_loc in self.local_data.unobstructed_locs:
 								return ['move', toward_loc] # take the move even if not safe
 							else: # take random of best non-obstructed location
-								return ['move', random.choice(self.local_data.least_dangerous_nonsafe_locs()) ]
+								return ['move', self.__choice(self.local_data.least_dangerous_nonsafe_locs()) ]
 						else:
-							return self.__passive_stance(random.choice(self.local_data.safe_locs))
+							return self.__passive_stance(self.__choice(self.local_data.safe_locs))
 				
 					# can move to non-spawn
 					else:
@@ -673,7 +2619,7 @@ class RobotCalculations:
 						else:
 							sfns =  self.local_data.safe_locs_non_spawn()
 							if sfns:
-								return self.__passive_stance(random.choice(sfns))
+								return self.__passive_stance(self.__choice(sfns))
 							else:
 								return self.__endangered_stance()
 
@@ -684,9 +2630,12 @@ class RobotCalculations:
 						if self.local_data.safe_locs:
 							sfns =  self.local_data.safe_locs_non_spawn()
 							if sfns:
-								return self.__passive_stance(random.choice(sfns))
-						# can move out, but not safe: rush out regardless!
-						return ['move', random.choice(self.local_data.normal_unobstructed_locs)]
+								return self.__passive_stance(self.__choice(sfns))
+						# can move out, but not safe: rush out regardless! (to a free exit if any)
+						route = self.arena_data.turn_data.escape_route(self.robot.location)
+						if route is not None and route[0] == 1:
+							return ['move', route[2]]
+						return ['move', self.__choice(self.local_data.normal_unobstructed_locs)]
 					
 					else:
 						# can't move to non-spawn
@@ -702,8 +2651,9 @@ class RobotCalculations:
 			else: #later game
 				#print self.local_data.immediate_enemies
 				if self.local_data.immediate_enemies:
-					# if in a bad spot!
-					badly_surrounded = len(self.local_data.immediate_enemies) >= 2 or (len(self.local_data.immediate_enemies) >= 1 and self.arena_data.quadrant_inferiority())
+					# if in a bad spot! (a lone enemy is no threat to a robot backed by its group)
+					badly_surrounded = len(self.local_data.immediate_enemies) >= 2 or (len(self.local_data.immediate_enemies) >= 1
+						and self.arena_data.group_size < PARAMS.group_support and self.__quadrant_inferiority())
 					#print "badly surrounded: " + str(badly_surrounded)
 					
 					if badly_surrounded:
@@ -715,33 +2665,48 @@ class RobotCalculations:
 				else:
 					if toward_loc in self.local_data.immediate_friends:
 						if self.local_data.safe_locs:
-							return self.__aggressive_stance(random.choice(self.local_data.safe_locs))
+							return self.__aggressive_stance(self.__choice(self.local_data.safe_locs))
 						else:
-							return self.__cautious_stance(random.choice(self.local_data.unobstructed_locs))
+							return self.__cautious_stance(self.__choice(self.local_data.unobstructed_locs))
 					else:
 						return self.__cautious_stance(toward_loc)
 
-		print "Not supposed to be here..."
+		print("Not supposed to be here...")
 		return ['guard']
 
 	########################################################################
 
-class Robot:
+def act_all(game, player_id=None):
+	"""Return {location: action} for all of a player's robots this turn.
 
-	def act(self, game):
+	The engine only gives robot_id to the robots of the player it asks, so
+	player_id defaults to the owner of those. Robot.act reads its move from
+	the same result; calling act_all and then act for the same turn decides
+	the team only once."""
 
-		#print "robot ID: " + str(self.robot_id)
+	if player_id is None:
+		player_id = next((rob.player_id for rob in game.robots.values()
+			if getattr(rob, 'robot_id', None) is not None), None)
+		if player_id is None:
+			return {}
 
-		# set up globals
-		random.seed()
-		robo_calc = RobotCalculations(self, game)
+	return TurnData.for_turn(game, player_id).actions()
 
-		# act
-		move = robo_calc.main()
 
-		# prevent move to one's own tile
-		if self.location in move:
-			#print "Moving to itself... fix before it gets here!"
-			return ['guard']
+	########################################################################
+
+
+class Robot:
+
+	@profiled('act', lambda robot, game: (game.turn, robot.location, robot.player_id))
+	def act(self, game):
+
+		#print "robot ID: " + str(self.robot_id)
 
+		# act: the whole team is decided on the first call of the turn
+		move = act_all(game, self.player_id).get(self.location)
+		if move is None:
+			move = TurnData.for_turn(game, self.player_id).plan().move_for(self)
+			if RECORDER is not None:
+				RECORDER.record(game, self, move)
 		return move
\ No newline at end of file
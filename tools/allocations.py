@@ -0,0 +1,238 @@
+"""Memory allocation benchmark of the bot's decisions (Python 3.9+, tracemalloc).
+
+Decides the scripted and random positions of benchmark.py, then the turns
+of a short local match (where the bot updates its turn data from the
+previous turn instead of building it cold), under tracemalloc. Reports per
+Robot.act, averaged over the robots decided:
+
+	- peak KB: high-water mark of memory allocated while deciding, above
+	  what was allocated before
+	- blocks: memory blocks allocated by the bot's own code while deciding
+	  and still alive afterwards (its per-turn state)
+	- gc: garbage collections triggered while deciding, per 100 turns
+
+Every position, and the match, is measured in a fresh interpreter with a
+fixed hash seed, after one unmeasured turn and a full collection before
+each measured one, so the figures do not depend on what was decided
+before or on hash ordering: identical code gives identical figures.
+
+Peak KB and blocks are compared to the baseline stored for this Python
+version in allocations_baseline.json, failing (exit code 1) if either is
+more than --tolerance above it; gc is shown for information only.
+--update stores the current figures as the baseline.
+
+Usage:
+	python tools/allocations.py [bot.py] [--update] [--tolerance 0.1]"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import rg  # noqa: E402
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT, SCRIPTED, random_position  # noqa: E402
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'allocations_baseline.json')
+METRICS = ('peak_kb', 'blocks', 'gc')
+GATED = ('peak_kb', 'blocks')
+
+
+class Meter(object):
+	"""Accumulates the allocation figures of the turns it measures."""
+
+	def __init__(self, bot_path):
+		self.filters = [tracemalloc.Filter(True, os.path.abspath(bot_path))]
+		self.turns = 0
+		self.robots = 0
+		self.peak = 0
+		self.blocks = 0
+		self.collections = 0
+
+	def __count_collection(self, phase, info):
+		if phase == 'start':
+			self.collections += 1
+
+	def decide(self, game, player):
+		"""Decide a player's turn in game, measuring it."""
+
+		robots = sum(1 for robot in game.robots.values() if robot.player_id == player.player_id)
+		if not robots:
+			return {}
+
+		gc.collect()
+		before = tracemalloc.take_snapshot().filter_traces(self.filters)
+		tracemalloc.reset_peak()
+		start = tracemalloc.get_traced_memory()[0]
+		gc.callbacks.append(self.__count_collection)
+		try:
+			actions = game.decide(player)[0]
+		finally:
+			gc.callbacks.remove(self.__count_collection)
+		peak = tracemalloc.get_traced_memory()[1] - start
+		after = tracemalloc.take_snapshot().filter_traces(self.filters)
+
+		self.turns += 1
+		self.robots += robots
+		self.peak += peak
+		self.blocks += sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+		return actions
+
+	def totals(self):
+		return {'turns': self.turns, 'robots': self.robots, 'peak': self.peak,
+			'blocks': self.blocks, 'collections': self.collections}
+
+
+def figures(totals):
+	"""Per robot figures from the summed totals of several Meters."""
+
+	robots = max(totals['robots'], 1)
+	return {
+		'peak_kb': round(totals['peak'] / 1024.0 / robots, 2),
+		'blocks': round(float(totals['blocks']) / robots, 2),
+		'gc': round(100.0 * totals['collections'] / max(totals['turns'], 1), 2),
+	}
+
+
+def placements(counts):
+	"""Setup name -> function(game, rnd) placing its robots."""
+
+	places = dict(SCRIPTED)
+	for count in counts:
+		places['random_%d' % count] = random_position(count)
+	return places
+
+
+def measure_position(bot_path, place, seed):
+	"""Decide one position with a freshly loaded bot, after an unmeasured
+	opening turn (the arena tables are built once per match, not per turn)."""
+
+	module = simulator.load_bot(bot_path, 'alloc_bot')
+	warm_up = simulator.LocalGame([module, module], seed=seed)
+	SCRIPTED[0][1](warm_up, random.Random(seed))
+	warm_up.decide(warm_up.players[0])
+
+	meter = Meter(bot_path)
+	game = simulator.LocalGame([module, module], seed=seed)
+	place(game, random.Random(seed))
+	meter.decide(game, game.players[0])
+	return meter.totals()
+
+
+def measure_match(bot_path, turns, seed):
+	"""Play a match against itself, measuring player 0's turns after the first."""
+
+	modules = [simulator.load_bot(bot_path, 'alloc_match_p%d' % p) for p in (0, 1)]
+	game = simulator.LocalGame(modules, seed=seed)
+	meter = Meter(bot_path)
+
+	while game.turn < turns:
+		game.turn += 1
+		if (game.turn - 1) % rg.settings.spawn_every == 0:
+			game.spawn()
+		actions = {}
+		for player in game.players:
+			# the first turn builds the arena tables, which is no per-turn cost
+			if player.player_id == 0 and game.turn > 1:
+				actions.update(meter.decide(game, player))
+			else:
+				actions.update(game.decide(player)[0])
+		game.apply(actions)
+
+	return meter.totals()
+
+
+def measure_in_child(args, setup, seed):
+	"""Run one measurement in a fresh interpreter; return its totals."""
+
+	env = dict(os.environ, PYTHONHASHSEED='0')
+	command = [sys.executable, os.path.abspath(__file__), args.bot, '--child', setup,
+		'--seed', str(seed), '--turns', str(args.turns), '--counts', args.counts]
+	output = subprocess.check_output(command, env=env)
+	return json.loads(output.decode('ascii').strip().splitlines()[-1])
+
+
+def compare(figures, baseline, tolerance):
+	"""Print figures next to the baseline; return the names of the regressions."""
+
+	print('%-18s %10s %10s %10s %10s %10s %10s' % ('position', 'peak KB', 'base', 'blocks', 'base', 'gc', 'base'))
+	regressions = []
+	for name in sorted(figures):
+		row = figures[name]
+		base = baseline.get(name, {})
+		cells = []
+		for metric in METRICS:
+			cells.extend([row[metric], base.get(metric, float('nan'))])
+			# small absolute slack so that near-zero figures do not trip it
+			if metric in GATED and metric in base and row[metric] > base[metric] * (1 + tolerance) + 0.5:
+				regressions.append('%s %s' % (name, metric))
+		print('%-18s %10.2f %10.2f %10.2f %10.2f %10.2f %10.2f' % tuple([name] + cells))
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Measure memory allocated per Robot.act and check it against a baseline.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--positions', type=int, default=5, help='positions per scripted or random setup')
+	parser.add_argument('--counts', default='30,90', help='robots on the board for random positions')
+	parser.add_argument('--turns', type=int, default=30, help='turns of the measured match')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative increase over the baseline')
+	parser.add_argument('--update', action='store_true', help='store these figures as the baseline')
+	parser.add_argument('--baseline', default=BASELINE)
+	parser.add_argument('--child', help=argparse.SUPPRESS) # measure one setup and print its totals
+	args = parser.parse_args()
+
+	# lookahead searches always run to full depth, so the figures do not depend on timing
+	os.environ.setdefault('STANCE_BOT_DEADLINE_MS', '1000000')
+	counts = [int(c) for c in args.counts.split(',') if c]
+
+	if args.child:
+		tracemalloc.start()
+		if args.child == 'match':
+			totals = measure_match(args.bot, args.turns, args.seed)
+		else:
+			totals = measure_position(args.bot, placements(counts)[args.child], args.seed)
+		print(json.dumps(totals))
+		return
+
+	results = {}
+	for name in sorted(placements(counts)):
+		summed = {}
+		for i in range(args.positions):
+			for key, value in measure_in_child(args, name, args.seed + i).items():
+				summed[key] = summed.get(key, 0) + value
+		results[name] = figures(summed)
+	results['match'] = figures(measure_in_child(args, 'match', args.seed))
+
+	version = 'python %d.%d' % sys.version_info[:2]
+	baselines = {}
+	if os.path.exists(args.baseline):
+		with open(args.baseline) as f:
+			baselines = json.load(f)
+
+	regressions = compare(results, baselines.get(version, {}), args.tolerance)
+
+	if args.update:
+		baselines[version] = results
+		with open(args.baseline, 'w') as f:
+			json.dump(baselines, f, indent=1, sort_keys=True)
+			f.write('\n')
+		print('baseline for %s updated' % version)
+	elif version not in baselines:
+		print('no baseline for %s, run with --update to store one' % version)
+	elif regressions:
+		print('regressed: %s' % ', '.join(regressions))
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
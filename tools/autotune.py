@@ -0,0 +1,158 @@
+"""Parameter auto-tuner: successive halving over candidate parameter sets.
+
+Starts from the bot's default Params and --candidates random variations of
+them (every tunable in SPACE drawn from its range), written to --workdir
+as candidate_<n>.json. Each round, the surviving candidates play
+--matches rotations on a pool of worker processes: in rotation i every
+survivor hosts the one i + 1 places after it (skipping itself), so each
+plays exactly twice --matches matches, half of them on each side, against
+an evenly spread field. Every match counts for both players. The better
+half by score (wins plus half the draws per match, then the robot
+margin) goes on to the next round, which plays twice as many rotations,
+until one candidate is left. Its SPACE values are written to --output;
+run the bot with STANCE_BOT_PARAMS=<output> to use them (the fields not
+in SPACE keep their defaults, STANCE_BOT_DEADLINE_MS included).
+
+Tuning matches run with the lookahead deadline off (see
+simulator.play_match()), so their outcomes do not depend on machine load
+unless STANCE_BOT_DEADLINE_MS is set, and their seeds depend only on --seed, the
+round and the rotation: every candidate of a round plays the same spawns
+and a run can be repeated.
+
+Usage:
+	python tools/autotune.py [bot.py] [--candidates 15] [--matches 4] [--output tuned_params.json]"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT  # noqa: E402
+
+
+# tunable -> (low, high), drawn uniformly; ints if both bounds are ints
+SPACE = {
+	'quadrant_ratio': (1.0, 2.5),
+	'quadrant_min_friends': (1, 4),
+	'opening_turns': (0, 6),
+	'chase_distance': (1, 6),
+	'group_support': (2, 6),
+	'danger_ratio': (0.6, 1.4),
+	'history_span': (1, 4),
+}
+
+
+def play_match(task):
+	"""Worker: play one match of a candidate against an opponent and return its result."""
+
+	match = simulator.play_match(task['bot'], task['bot'], task['seed'], task['side'], task['turns'],
+		params=task['params'], opponent_params=task['opponent_params'])
+	return {
+		'candidate': task['candidate'],
+		'opponent': task['opponent'],
+		'score': {'win': 1.0, 'draw': 0.5, 'loss': 0.0}[match['result']],
+		'margin': match['robots'] - match['opponent_robots'],
+	}
+
+
+def make_candidates(defaults, count, rnd):
+	"""The defaults, then count random variations of them (SPACE keys only)."""
+
+	candidates = [dict((name, defaults[name]) for name in SPACE)]
+	for _ in range(count):
+		params = {}
+		for name, (low, high) in sorted(SPACE.items()):
+			if isinstance(low, int) and isinstance(high, int):
+				params[name] = rnd.randint(low, high)
+			else:
+				params[name] = round(rnd.uniform(low, high), 3)
+		candidates.append(params)
+	return candidates
+
+
+def play_round(pool, bot, paths, survivors, matches, seed, turns):
+	"""Play matches rotations of the survivors; return candidate ->
+	[score, margin, matches played], summed over both sides of every match."""
+
+	tasks = []
+	for i in range(matches):
+		offset = i % (len(survivors) - 1) + 1
+		for k, candidate in enumerate(survivors):
+			opponent = survivors[(k + offset) % len(survivors)]
+			tasks.append({'bot': bot, 'candidate': candidate, 'opponent': opponent, 'params': paths[candidate],
+				'opponent_params': paths[opponent], 'seed': seed + i, 'side': i % 2, 'turns': turns})
+
+	totals = dict((candidate, [0.0, 0, 0]) for candidate in survivors)
+	for result in pool.imap_unordered(play_match, tasks):
+		for candidate, score, margin in ((result['candidate'], result['score'], result['margin']),
+				(result['opponent'], 1.0 - result['score'], -result['margin'])):
+			totals[candidate][0] += score
+			totals[candidate][1] += margin
+			totals[candidate][2] += 1
+	return totals
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Tune the bot\'s Params by successive halving over local matches.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--candidates', type=int, default=15, help='random candidates besides the defaults')
+	parser.add_argument('--matches', type=int, default=4, help='rotations in the first round (each candidate plays twice as many matches)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--turns', type=int, default=None, help='turns per match (default: max_turns)')
+	parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count())
+	parser.add_argument('--workdir', default='autotune', help='where the candidates\' parameter files go')
+	parser.add_argument('--output', default='tuned_params.json')
+	args = parser.parse_args()
+
+	bot = os.path.abspath(args.bot)
+	defaults = simulator.load_bot(bot, 'autotune_defaults').Params().as_dict()
+	candidates = make_candidates(defaults, args.candidates, random.Random(args.seed))
+
+	if not os.path.isdir(args.workdir):
+		os.makedirs(args.workdir)
+	paths = []
+	for i, params in enumerate(candidates):
+		paths.append(os.path.abspath(os.path.join(args.workdir, 'candidate_%d.json' % i)))
+		with open(paths[-1], 'w') as f:
+			json.dump(params, f, indent=1, sort_keys=True)
+
+	survivors = list(range(len(candidates)))
+	matches = args.matches
+	pool = multiprocessing.Pool(args.jobs, maxtasksperchild=20)
+	try:
+		for round_num in itertools.count():
+			if len(survivors) <= 1:
+				break
+			totals = play_round(pool, bot, paths, survivors, matches, args.seed + 10000 * round_num, args.turns)
+			rates = dict((c, (totals[c][0] / totals[c][2], float(totals[c][1]) / totals[c][2])) for c in survivors)
+			ranked = sorted(survivors, key=lambda c: (-rates[c][0], -rates[c][1], c))
+
+			print('round %d: %d candidates, %d matches each' % (round_num + 1, len(survivors), 2 * matches))
+			print('  %-10s %6s %7s' % ('candidate', 'score', 'margin'))
+			for candidate in ranked:
+				print('  %-10d %5.1f%% %7.2f' % (candidate, 100.0 * rates[candidate][0], rates[candidate][1]))
+
+			survivors = ranked[:(len(ranked) + 1) // 2]
+			matches *= 2
+	finally:
+		pool.terminate()
+		pool.join()
+
+	best = survivors[0]
+	with open(args.output, 'w') as f:
+		json.dump(candidates[best], f, indent=1, sort_keys=True)
+		f.write('\n')
+	print('best: candidate %d%s, written to %s' % (best, ' (the defaults)' if best == 0 else '', args.output))
+	for name in sorted(SPACE):
+		print('  %-22s %s (default %s)' % (name, candidates[best][name], defaults[name]))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,169 @@
+"""Per-turn decision latency benchmark.
+
+Times how long a bot takes to decide all of its robots' actions in one
+turn, over scripted positions and over random positions of growing size,
+and reports p50/p99/max latency against the engine's per-turn time limit.
+Every sample gets a fresh game_info, and bots exposing new_position() are
+told to forget what they carried over from the last sample (previous
+turns, cached decisions), so every sample is decided like the first turn
+after an unrelated one. Caches of the map alone, which last a whole
+match, stay warm. With --matches, whole local matches are also played and
+every turn of the bot is timed (there the bot reuses the previous turn, as
+it would live).
+
+Usage:
+	python tools/benchmark.py [bot.py] [--counts 10,30,60,90] [--limit-ms 300]"""
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import rg  # noqa: E402
+import simulator  # noqa: E402
+
+
+DEFAULT_BOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stance-bot.py')
+
+
+def passable_tiles():
+	size = rg.settings.board_size
+	return [(x, y) for x in range(size) for y in range(size) if 'obstacle' not in rg.loc_types((x, y))]
+
+
+def percentile(samples, fraction):
+	"""Nearest-rank percentile of a sorted list."""
+
+	if not samples:
+		return 0.0
+	rank = max(0, min(len(samples) - 1, int(math.ceil(fraction * len(samples))) - 1))
+	return samples[rank]
+
+
+# scripted positions: name -> function(game, rnd) placing robots and setting the turn
+
+def opening(game, rnd):
+	game.turn = 1
+	game.spawn()
+
+def spawn_evacuation(game, rnd):
+	"""Both sides crowded on spawn tiles the turn before they are cleared."""
+
+	game.turn = rg.settings.spawn_every
+	spawn = list(rg.settings.spawn_coords)
+	rnd.shuffle(spawn)
+	for i, loc in enumerate(spawn[:len(spawn) * 3 // 4]):
+		game.add_robot(loc, i % 2, rnd.randint(1, rg.settings.robot_hp))
+
+def melee(game, rnd):
+	"""Two blobs fighting across the middle of the arena."""
+
+	game.turn = 35
+	for loc in passable_tiles():
+		if abs(loc[1] - 9) <= 4 and abs(loc[0] - 9) <= 6:
+			game.add_robot(loc, 0 if loc[0] < 9 else 1, rnd.randint(1, rg.settings.robot_hp))
+
+def surrounded(game, rnd):
+	"""A tight group of ours encircled by enemies."""
+
+	game.turn = 52
+	for loc in passable_tiles():
+		d = rg.wdist(loc, rg.CENTER_POINT)
+		if d <= 2:
+			game.add_robot(loc, 0, rnd.randint(1, rg.settings.robot_hp))
+		elif d <= 4:
+			game.add_robot(loc, 1, rnd.randint(1, rg.settings.robot_hp))
+
+SCRIPTED = [('opening', opening), ('spawn_evacuation', spawn_evacuation), ('melee', melee), ('surrounded', surrounded)]
+
+
+def random_position(count):
+	def place(game, rnd):
+		game.turn = rnd.randint(1, rg.settings.max_turns - 1)
+		for i, loc in enumerate(rnd.sample(passable_tiles(), count)):
+			game.add_robot(loc, i % 2, rnd.randint(1, rg.settings.robot_hp))
+	return place
+
+
+def time_position(module, place, seed, repeats):
+	"""Seconds the bot (player 0) takes to decide a position, once per repeat."""
+
+	game = simulator.LocalGame([module, module], seed=seed)
+	place(game, random.Random(seed))
+	player = game.players[0]
+
+	samples = []
+	for _ in range(repeats):
+		if hasattr(module, 'new_position'):
+			module.new_position()
+		samples.append(game.decide(player)[1])
+	return samples
+
+
+def time_matches(module_path, matches, seed):
+	samples = []
+	for i in range(matches):
+		modules = [simulator.load_bot(module_path, 'bench_match%d_p%d' % (i, p)) for p in (0, 1)]
+		game = simulator.LocalGame(modules, seed=seed + i)
+		game.play()
+		samples.extend(game.turn_times[0])
+	return samples
+
+
+def report(rows, limit):
+	print('%-18s %7s %8s %9s %9s %9s %6s' % ('position', 'robots', 'samples', 'p50 ms', 'p99 ms', 'max ms', 'over'))
+	failed = False
+	for name, robots, samples in rows:
+		samples = sorted(s * 1000.0 for s in samples)
+		over = sum(1 for s in samples if s > limit)
+		failed = failed or percentile(samples, 0.99) > limit
+		print('%-18s %7s %8d %9.2f %9.2f %9.2f %6d' % (
+			name, robots, len(samples), percentile(samples, 0.5), percentile(samples, 0.99), samples[-1] if samples else 0.0, over))
+	print('time limit: %.0f ms per turn' % limit)
+	return failed
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark per-turn decision latency of a bot.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--counts', default='10,30,60,90', help='robots on the board for random positions')
+	parser.add_argument('--positions', type=int, default=10, help='random positions per robot count')
+	parser.add_argument('--repeats', type=int, default=5, help='timed decisions per position')
+	parser.add_argument('--matches', type=int, default=0, help='also time every turn of this many local matches')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--limit-ms', type=float, default=300.0, help='engine time limit per turn')
+	parser.add_argument('--strict', action='store_true', help='exit with 1 if any p99 is over the limit')
+	args = parser.parse_args()
+
+	module = simulator.load_bot(args.bot, 'bench_bot')
+	rows = []
+
+	for name, place in SCRIPTED:
+		samples = []
+		for i in range(args.positions):
+			samples.extend(time_position(module, place, args.seed + i, args.repeats))
+		game = simulator.LocalGame([module, module], seed=args.seed)
+		place(game, random.Random(args.seed))
+		robots = len(game.robots)
+		rows.append((name, robots, samples))
+
+	for count in [int(c) for c in args.counts.split(',') if c]:
+		samples = []
+		for i in range(args.positions):
+			samples.extend(time_position(module, random_position(count), args.seed + i, args.repeats))
+		rows.append(('random', count, samples))
+
+	if args.matches:
+		rows.append(('matches', '-', time_matches(args.bot, args.matches, args.seed)))
+
+	failed = report(rows, args.limit_ms)
+	if args.strict and failed:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,17 @@
+"""Baseline opponent: attack an adjacent enemy if there is one, otherwise
+walk to the center of the arena (nothing special about spawn tiles)."""
+
+import rg
+
+
+class Robot:
+
+	def act(self, game):
+
+		for loc, bot in game.robots.items():
+			if bot.player_id != self.player_id and rg.wdist(loc, self.location) <= 1:
+				return ['attack', loc]
+
+		if self.location == rg.CENTER_POINT:
+			return ['guard']
+		return ['move', rg.toward(self.location, rg.CENTER_POINT)]
@@ -0,0 +1,7 @@
+"""Baseline opponent: every robot guards, every turn."""
+
+
+class Robot:
+
+	def act(self, game):
+		return ['guard']
@@ -0,0 +1,94 @@
+"""Incremental turn data parity check.
+
+Plays local matches and, after every turn, builds the bot's TurnData for
+player 0 twice: patched from the previous turn (as the bot does during a
+match) and rebuilt from nothing. Every turn-wide structure of the two
+must be equal: occupancy and masks, groups, threat counts and damage,
+nearest enemy field and quadrant counts. The first difference of each
+match is printed; exit code 1 if there was any.
+
+Usage:
+	python tools/parity.py [bot.py] [--opponent other.py ...] [--matches 3] [--turns 100]"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT  # noqa: E402
+from tournament import BASELINES  # noqa: E402
+
+
+TURN_FIELDS = ('occupancy', 'robots_mask', 'friends_mask', 'foes_mask', 'foes_reach_mask',
+	'group_ids', 'group_masks', 'group_sizes')
+THREAT_FIELDS = ('enemy_counts', 'low_hp_counts', 'idle_counts', 'damages')
+QUADRANT_FIELDS = ('friend_count', 'foe_count', 'friend_hp', 'foe_hp')
+
+
+def differences(patched, rebuilt):
+	"""Names of the structures that differ between two TurnData of the same turn."""
+
+	names = [name for name in TURN_FIELDS if getattr(patched, name) != getattr(rebuilt, name)]
+	names.extend('threat.' + name for name in THREAT_FIELDS
+		if list(getattr(patched.threat, name)) != list(getattr(rebuilt.threat, name)))
+	if (list(patched.nearest_foes.distances) != list(rebuilt.nearest_foes.distances)
+			or patched.nearest_foes.foes != rebuilt.nearest_foes.foes):
+		names.append('nearest_foes')
+	for num, (a, b) in enumerate(zip(patched.quadrants, rebuilt.quadrants), 1):
+		names.extend('quadrant %d %s' % (num, name) for name in QUADRANT_FIELDS
+			if getattr(a, name) != getattr(b, name))
+	return names
+
+
+def check_match(bot, opponent, seed, turns):
+	"""Play a match; return (turns patched, first difference or None)."""
+
+	module = simulator.load_bot(bot, 'parity%d_p0' % seed)
+	game = simulator.LocalGame([module, simulator.load_bot(opponent, 'parity%d_p1' % seed)], seed=seed)
+
+	previous = None
+	patched_turns = 0
+	while game.turn < turns:
+		game.play_turn()
+		game_info = game.game_info(0)
+		patched = module.TurnData(game_info, 0, previous=previous)
+		rebuilt = module.TurnData(game_info, 0)
+		if patched.changes is not None:
+			patched_turns += 1
+			names = differences(patched, rebuilt)
+			if names:
+				return patched_turns, 'turn %d: %s' % (game.turn, ', '.join(names))
+		previous = patched
+	return patched_turns, None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Check incremental turn data against rebuilt turn data.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--opponent', action='append', help='opponent bot file (default: the bot itself and tools/bots/*)')
+	parser.add_argument('--matches', type=int, default=3, help='matches per opponent')
+	parser.add_argument('--turns', type=int, default=100)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	opponents = args.opponent or [args.bot] + BASELINES
+	failed = False
+	total = 0
+	for opponent in opponents:
+		for i in range(args.matches):
+			patched_turns, difference = check_match(args.bot, opponent, args.seed + i, args.turns)
+			total += patched_turns
+			if difference is not None:
+				failed = True
+				print('%s, seed %d, %s' % (os.path.basename(opponent), args.seed + i, difference))
+
+	print('%d patched turns checked, %s' % (total, 'differences found' if failed else 'no differences'))
+	if failed:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,70 @@
+"""Profiler turn attribution check.
+
+Plays a short local match with the bot profiling itself (as with
+STANCE_BOT_PROFILE) and checks that every stage was filed under the turn
+it ran in: no time under an unknown turn, and every turn's TurnData
+build or update under that turn, the first turn's included. Exit code 1
+if not.
+
+Usage:
+	python tools/profile_turns.py [bot.py] [--turns 12] [--seed 0]"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT  # noqa: E402
+
+
+def profiled_turns(bot, turns, seed):
+	"""Play a match with player 0 profiled; return its profile's turn -> stage -> seconds."""
+
+	workdir = tempfile.mkdtemp()
+	previous = os.environ.get('STANCE_BOT_PROFILE')
+	os.environ['STANCE_BOT_PROFILE'] = os.path.join(workdir, 'profile')
+	try:
+		module = simulator.load_bot(bot, 'profile_turns_p0')
+	finally:
+		if previous is None:
+			del os.environ['STANCE_BOT_PROFILE']
+		else:
+			os.environ['STANCE_BOT_PROFILE'] = previous
+
+	try:
+		game = simulator.LocalGame([module, simulator.load_bot(bot, 'profile_turns_p1')], seed=seed)
+		game.play(turns)
+		return module.PROFILER.summary()['turns']
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Check that profiled stages are filed under the right turn.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--turns', type=int, default=12)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	by_turn = profiled_turns(args.bot, args.turns, args.seed)
+	problems = []
+	if 'None' in by_turn:
+		problems.append('%.2f ms filed under no turn' % (1000.0 * by_turn['None'].get('total', 0.0)))
+	for turn in range(1, args.turns + 1):
+		if by_turn.get(str(turn), {}).get('TurnData', 0.0) <= 0.0:
+			problems.append('turn %d has no TurnData time' % turn)
+
+	for problem in problems:
+		print(problem)
+	print('%d turns profiled, %s' % (args.turns, 'misattributed' if problems else 'every stage under its turn'))
+	if problems:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,118 @@
+"""Decision-parity replayer for the bot's binary recordings.
+
+Run a match with STANCE_BOT_RECORD=<prefix> to record every turn the bot
+sees and every move it makes in <prefix>.<player_id>.replay. This tool
+memory-maps such a file and streams it back through a bot, at full speed:
+
+	- it reports decision throughput on real games, offline
+	- it checks that the bot (by default the current stance-bot.py, or any
+	  other version given) makes exactly the recorded moves, reseeding its
+	  random stream wherever the recording did. Exits with 1 on a mismatch.
+
+Recordings replay exactly on the Python version they were made with (the
+random module draws differently on Python 2 and 3).
+
+Usage:
+	python tools/replay.py game.0.replay [bot.py] [--show 10]"""
+
+from __future__ import print_function
+
+import argparse
+import mmap
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import rg  # noqa: E402
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT, percentile  # noqa: E402
+
+
+def records(bot, path):
+	"""Yield the decoded records of a recording, in order."""
+
+	with open(path, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			for offset in range(0, len(data) - bot.RECORD_SIZE + 1, bot.RECORD_SIZE):
+				kind = bot.RECORD.unpack_from(data, offset)[0]
+				if kind == bot.REC_SEED:
+					yield kind, bot.SEED_RECORD.unpack_from(data, offset)[1:]
+				else:
+					yield kind, bot.RECORD.unpack_from(data, offset)[1:]
+		finally:
+			data.close()
+
+
+def replay(bot, path, show=10):
+	"""Feed a recording to bot; return (decisions, mismatches, per-turn seconds)."""
+
+	player = bot.Robot()
+	game = None
+	decisions = 0
+	mismatches = 0
+	turn_times = []
+
+	for kind, fields in records(bot, path):
+		if kind == bot.REC_SEED:
+			bot.seed_random(fields[0])
+
+		elif kind == bot.REC_TURN:
+			game = rg.AttrDict(robots={}, turn=fields[0])
+			turn_times.append(0.0)
+
+		elif kind == bot.REC_ROBOT:
+			turn, x, y, hp, player_id, _, _, _, robot_id = fields
+			info = rg.AttrDict(location=(x, y), hp=hp, player_id=player_id)
+			if robot_id >= 0:
+				info.robot_id = robot_id
+			game.robots[(x, y)] = info
+
+		elif kind == bot.REC_ACTION:
+			turn, x, y, hp, player_id, code, tx, ty, robot_id = fields
+			player.location = (x, y)
+			player.hp = hp
+			player.player_id = player_id
+			player.robot_id = robot_id
+
+			start = time.time()
+			move = player.act(game)
+			turn_times[-1] += time.time() - start
+
+			expected = [bot.ACTIONS[code - 1]]
+			if expected[0] in ('move', 'attack'):
+				expected.append((tx, ty))
+			if [move[0]] + [tuple(m) for m in move[1:]] != expected:
+				mismatches += 1
+				if mismatches <= show:
+					print('turn %d, robot at %s: recorded %s, replayed %s' % (turn, (x, y), expected, move))
+			decisions += 1
+
+	return decisions, mismatches, turn_times
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay a recording through a bot and check its decisions.')
+	parser.add_argument('recording')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--show', type=int, default=10, help='mismatches to print')
+	args = parser.parse_args()
+
+	bot = simulator.load_bot(args.bot, 'replayed_bot')
+	start = time.time()
+	decisions, mismatches, turn_times = replay(bot, args.recording, args.show)
+	elapsed = time.time() - start
+
+	turn_ms = sorted(t * 1000.0 for t in turn_times)
+	print('%d turns, %d decisions in %.2f s: %.0f decisions/s, %.0f turns/s' % (
+		len(turn_times), decisions, elapsed, decisions / max(elapsed, 1e-9), len(turn_times) / max(elapsed, 1e-9)))
+	print('per turn: p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+		percentile(turn_ms, 0.5), percentile(turn_ms, 0.99), turn_ms[-1] if turn_ms else 0.0))
+	print('%d mismatching decisions' % mismatches)
+	if mismatches:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
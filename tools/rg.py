@@ -0,0 +1,130 @@
+"""Offline stand-in for the robotgame `rg` module.
+
+Provides the same helpers and settings the engine exposes to bots, on the
+default circular 19x19 arena, so that bots can be run without the engine.
+Use load_map() to play on one of the engine's map files instead."""
+
+import ast
+import math
+
+
+class AttrDict(dict):
+	"""dict whose keys can also be read and written as attributes."""
+
+	def __getattr__(self, key):
+		try:
+			return self[key]
+		except KeyError:
+			raise AttributeError(key)
+
+	def __setattr__(self, key, value):
+		self[key] = value
+
+
+CENTER_POINT = (9, 9)
+
+
+def default_map(board_size=19, radius_squared=70):
+	"""Return the default arena: a disc of normal tiles inside a wall, with a
+	ring of spawn tiles along the inner edge of the wall."""
+
+	center = board_size // 2
+	obstacles = set()
+	for x in range(board_size):
+		for y in range(board_size):
+			if (x - center) ** 2 + (y - center) ** 2 > radius_squared:
+				obstacles.add((x, y))
+
+	spawn = set()
+	for x in range(board_size):
+		for y in range(board_size):
+			if (x, y) not in obstacles and any(loc in obstacles for loc in _around((x, y))):
+				spawn.add((x, y))
+
+	return {'spawn': sorted(spawn), 'obstacle': sorted(obstacles)}
+
+
+settings = AttrDict(
+	spawn_every=10,
+	spawn_per_player=5,
+	board_size=19,
+	robot_hp=50,
+	attack_range=(8, 10),
+	collision_damage=5,
+	suicide_damage=15,
+	max_turns=100,
+	spawn_coords=[],
+	obstacles=[],
+)
+
+
+def set_map(map_data):
+	"""Use a map given as {'spawn': [...], 'obstacle': [...]}."""
+
+	settings.spawn_coords = [tuple(loc) for loc in map_data['spawn']]
+	settings.obstacles = [tuple(loc) for loc in map_data['obstacle']]
+	_spawn.clear()
+	_spawn.update(settings.spawn_coords)
+	_obstacles.clear()
+	_obstacles.update(settings.obstacles)
+
+
+def load_map(path):
+	"""Use a map file in the engine's format (a python dict literal)."""
+
+	with open(path) as f:
+		set_map(ast.literal_eval(f.read()))
+
+
+def dist(p1, p2):
+	return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+
+
+def wdist(p1, p2):
+	return abs(p1[0] - p2[0]) + abs(p1[1] - p2[1])
+
+
+def loc_types(loc):
+	for i in range(2):
+		if not 0 <= loc[i] < settings.board_size:
+			return ['invalid']
+
+	types = ['normal']
+	if loc in _spawn:
+		types.append('spawn')
+	if loc in _obstacles:
+		types.append('obstacle')
+	return types
+
+
+def locs_around(loc, filter_out=None):
+	if filter_out is None:
+		filter_out = ()
+	elif isinstance(filter_out, str):
+		filter_out = (filter_out,)
+	filter_out = set(filter_out)
+
+	return [new_loc for new_loc in _around(loc) if not filter_out & set(loc_types(new_loc))]
+
+
+def toward(curr, dest):
+	if curr == dest:
+		return curr
+
+	x0, y0 = curr
+	x, y = dest
+	x_diff, y_diff = x - x0, y - y0
+
+	if abs(x_diff) < abs(y_diff):
+		return (x0, y0 + (1 if y_diff > 0 else -1))
+	return (x0 + (1 if x_diff > 0 else -1), y0)
+
+
+def _around(loc):
+	x, y = loc
+	return [(x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)]
+
+
+_spawn = set()
+_obstacles = set()
+set_map(default_map())
@@ -0,0 +1,396 @@
+"""Headless local match simulator.
+
+Plays bots against each other without the robotgame engine, following its
+rules closely enough to exercise and time them:
+
+	- turns are numbered from 1; before every turn t with
+	  (t - 1) % spawn_every == 0, robots standing on spawn tiles die and
+	  every player gets spawn_per_player new robots on free spawn tiles
+	- moves are resolved first: robots moving onto the same tile, into a
+	  robot that stays, or swapping places all stay put, and enemies
+	  bumping into each other take collision_damage (unless guarding)
+	- attacks then hit the enemy standing on the target tile, suicides hit
+	  every adjacent enemy; guarding halves both
+	- invalid actions and exceptions count as guarding
+
+Bots exposing act_all(game_info, player_id) decide their whole team in
+one call; the others get one Robot.act call per robot.
+
+Bots are loaded from their file with load_bot(), once per player, so
+module level state is never shared between the two sides; play_match()
+plays one such match for the tournament and the auto-tuner. Given a seed,
+a match is reproducible as long as the bots do not look at the clock:
+bots exposing seed_random(seed) get one derived from it, and with --seed
+the stance bot's lookahead deadline is off unless STANCE_BOT_DEADLINE_MS
+is set (see without_deadline(); play_match() always does this).
+
+Usage:
+	python tools/simulator.py stance-bot.py stance-bot.py [--seed N]"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import rg  # noqa: E402 (the local stand-in, found through the path above)
+
+
+def load_bot(path, name=None, params=None):
+	"""Load a bot file as a fresh module (file names need not be valid identifiers),
+	reading its Params from the file params, if given, instead of STANCE_BOT_PARAMS."""
+
+	name = name or 'bot_%d' % id(path)
+	previous = os.environ.get('STANCE_BOT_PARAMS')
+	if params is not None:
+		os.environ['STANCE_BOT_PARAMS'] = params
+	try:
+		try:
+			import importlib.util
+		except ImportError: # Python 2
+			import imp
+			return imp.load_source(name, path)
+
+		spec = importlib.util.spec_from_file_location(name, path)
+		module = importlib.util.module_from_spec(spec)
+		sys.modules[name] = module
+		spec.loader.exec_module(module)
+		return module
+	finally:
+		if params is not None:
+			if previous is None:
+				del os.environ['STANCE_BOT_PARAMS']
+			else:
+				os.environ['STANCE_BOT_PARAMS'] = previous
+
+
+def without_deadline():
+	"""Turn off the wall clock lookahead of bots loaded from now on, unless
+	STANCE_BOT_DEADLINE_MS is set already: how far a search gets before its
+	deadline depends on machine load, so seeded matches would not replay."""
+
+	os.environ.setdefault('STANCE_BOT_DEADLINE_MS', '0')
+
+
+class Robot(object):
+	"""Engine side state of a robot."""
+
+	__slots__ = ('location', 'hp', 'player_id', 'robot_id')
+
+	def __init__(self, location, hp, player_id, robot_id):
+		self.location = location
+		self.hp = hp
+		self.player_id = player_id
+		self.robot_id = robot_id
+
+
+class Player(object):
+	"""A bot module and the Robot instance the engine hands locations to."""
+
+	def __init__(self, player_id, module):
+		self.player_id = player_id
+		self.module = module
+		self.robot = module.Robot()
+		self.exceptions = 0
+
+	def act(self, robot, game_info):
+		self.robot.location = robot.location
+		self.robot.hp = robot.hp
+		self.robot.player_id = robot.player_id
+		self.robot.robot_id = robot.robot_id
+		try:
+			return self.robot.act(game_info)
+		except Exception:
+			self.exceptions += 1
+			return ['guard']
+
+	def act_all(self, game_info):
+		"""The whole team's actions by location, from the module's act_all()."""
+
+		try:
+			return self.module.act_all(game_info, self.player_id)
+		except Exception:
+			self.exceptions += 1
+			return {}
+
+
+class LocalGame(object):
+	"""A match between two players.
+
+	Constructor:
+		LocalGame(modules, seed=None)
+
+	Fields:
+		Player[] players
+		dict robots -> location to Robot
+		int turn -> last turn played
+		float[][] turn_times -> per player, seconds spent deciding each turn
+
+	Public methods:
+		game_info(player_id)
+		add_robot(location, player_id, hp=None)
+		spawn()
+		play_turn()
+		decide(player)
+		play(turns=None)
+		dict robot_counts()
+		int winner()"""
+
+	def __init__(self, modules, seed=None):
+
+		self.random = random.Random(seed)
+		self.players = [Player(player_id, module) for player_id, module in enumerate(modules)]
+
+		# bots that can seed their own random stream replay identically too
+		if seed is not None:
+			for player in self.players:
+				if hasattr(player.module, 'seed_random'):
+					player.module.seed_random(seed * 2 + player.player_id)
+		self.robots = {}
+		self.turn = 0
+		self.next_robot_id = 0
+		self.turn_times = [[] for _ in self.players]
+		self.on_actions = None # optional callback(game, actions) after each turn's decisions
+
+	def game_info(self, player_id):
+		"""What a player's robots see: every robot, robot_id only for its own."""
+
+		robots = {}
+		for loc, robot in sorted(self.robots.items()):
+			info = rg.AttrDict(location=loc, hp=robot.hp, player_id=robot.player_id)
+			if robot.player_id == player_id:
+				info.robot_id = robot.robot_id
+			robots[loc] = info
+		return rg.AttrDict(robots=robots, turn=self.turn)
+
+	def add_robot(self, location, player_id, hp=None):
+		robot = Robot(location, rg.settings.robot_hp if hp is None else hp, player_id, self.next_robot_id)
+		self.next_robot_id += 1
+		self.robots[location] = robot
+		return robot
+
+	def spawn(self):
+		"""Clear the spawn tiles and drop in each player's new robots."""
+
+		for loc in rg.settings.spawn_coords:
+			self.robots.pop(loc, None)
+
+		free = list(rg.settings.spawn_coords)
+		self.random.shuffle(free)
+		for _ in range(rg.settings.spawn_per_player):
+			for player in self.players:
+				if free:
+					self.add_robot(free.pop(), player.player_id)
+
+	def play_turn(self):
+		"""Play one turn: spawn if due, collect every action, apply them."""
+
+		self.turn += 1
+		if (self.turn - 1) % rg.settings.spawn_every == 0:
+			self.spawn()
+
+		actions = self.collect_actions()
+		if self.on_actions is not None:
+			self.on_actions(self, actions)
+		self.apply(actions)
+
+	def collect_actions(self):
+		"""Ask every robot for its action, timing each player's whole turn."""
+
+		actions = {}
+		for player in self.players:
+			player_actions, seconds = self.decide(player)
+			actions.update(player_actions)
+			self.turn_times[player.player_id].append(seconds)
+		return actions
+
+	def decide(self, player):
+		"""Return the actions of a player's robots and the seconds it took to decide them."""
+
+		actions = {}
+		game_info = self.game_info(player.player_id)
+		start = time.time()
+		batch = player.act_all(game_info) if hasattr(player.module, 'act_all') else None
+		for loc in sorted(self.robots):
+			robot = self.robots[loc]
+			if robot.player_id == player.player_id:
+				if batch is None:
+					action = player.act(robot, game_info)
+				else:
+					action = batch.get(loc, ['guard'])
+				actions[loc] = self.check_action(robot, action)
+		return actions, time.time() - start
+
+	def check_action(self, robot, action):
+		"""Return action if it is legal for robot, ['guard'] otherwise."""
+
+		try:
+			kind = action[0]
+			if kind in ('guard', 'suicide'):
+				return [kind]
+			if kind in ('move', 'attack'):
+				target = tuple(action[1])
+				if rg.wdist(robot.location, target) == 1:
+					if kind == 'attack' or 'obstacle' not in rg.loc_types(target):
+						return [kind, target]
+		except (TypeError, IndexError, ValueError):
+			pass
+		return ['guard']
+
+	def apply(self, actions):
+		"""Resolve moves, then attacks and suicides, then remove the dead."""
+
+		guarding = set(loc for loc, action in actions.items() if action[0] == 'guard')
+		damage = dict((robot, 0) for robot in self.robots.values())
+
+		# moves
+		dest = {}
+		for loc, robot in self.robots.items():
+			action = actions.get(loc, ['guard'])
+			dest[robot] = action[1] if action[0] == 'move' else loc
+
+		bumped = set()
+		changed = True
+		while changed:
+			changed = False
+			by_dest = {}
+			for robot, target in dest.items():
+				by_dest.setdefault(target, []).append(robot)
+
+			for target, robots in by_dest.items():
+				if len(robots) > 1:
+					for robot in robots:
+						if dest[robot] != robot.location:
+							dest[robot] = robot.location
+							changed = True
+						for other in robots:
+							if other is not robot:
+								bumped.add(frozenset((robot, other)))
+
+			for robot, target in dest.items():
+				other = self.robots.get(target)
+				if other is not None and other is not robot and dest[other] == robot.location:
+					dest[robot] = robot.location
+					dest[other] = other.location
+					bumped.add(frozenset((robot, other)))
+					changed = True
+
+		for pair in bumped:
+			a, b = tuple(pair)
+			if a.player_id != b.player_id:
+				for robot in (a, b):
+					if robot.location not in guarding:
+						damage[robot] += rg.settings.collision_damage
+
+		# attacks and suicides land where robots are after moving
+		moved = dict((dest[robot], robot) for robot in dest)
+		guarding_robots = set(self.robots[loc] for loc in guarding)
+
+		def hurt(location, player_id, amount):
+			victim = moved.get(location)
+			if victim is not None and victim.player_id != player_id:
+				if victim in guarding_robots:
+					amount //= 2
+				damage[victim] += amount
+
+		for loc, action in actions.items():
+			robot = self.robots[loc]
+			if action[0] == 'attack':
+				hurt(action[1], robot.player_id, self.random.randint(*rg.settings.attack_range))
+			elif action[0] == 'suicide':
+				damage[robot] += robot.hp
+				for around in rg.locs_around(dest[robot]):
+					hurt(around, robot.player_id, rg.settings.suicide_damage)
+
+		self.robots = {}
+		for robot, location in sorted(dest.items(), key=lambda item: item[0].robot_id):
+			robot.hp -= damage[robot]
+			robot.location = location
+			if robot.hp > 0:
+				self.robots[location] = robot
+
+	def play(self, turns=None):
+		"""Play until turns (default: max_turns) have been played."""
+
+		turns = rg.settings.max_turns if turns is None else turns
+		while self.turn < turns:
+			self.play_turn()
+
+		# bots that profile or record themselves write their files out now
+		for player in self.players:
+			if hasattr(player.module, 'match_over'):
+				player.module.match_over()
+
+		return self.winner()
+
+	def robot_counts(self):
+		counts = dict((player.player_id, 0) for player in self.players)
+		for robot in self.robots.values():
+			counts[robot.player_id] += 1
+		return counts
+
+	def winner(self):
+		"""Player id with the most robots left, None on a draw."""
+
+		counts = self.robot_counts()
+		if counts[0] == counts[1]:
+			return None
+		return 0 if counts[0] > counts[1] else 1
+
+
+def play_match(bot, opponent, seed, side=0, turns=None, params=None, opponent_params=None):
+	"""Play bot, as player side, against opponent, both loaded fresh (with the
+	Params files given, if any) and without lookahead deadline; return the
+	outcome from bot's side as plain data:
+	result ('win', 'loss' or 'draw'), robots, opponent_robots, turn_ms, exceptions."""
+
+	without_deadline()
+	names = ['match%d_p0' % seed, 'match%d_p1' % seed]
+	bots = [(bot, params), (opponent, opponent_params)]
+	if side == 1:
+		bots.reverse()
+
+	modules = [load_bot(path, name, bot_params) for (path, bot_params), name in zip(bots, names)]
+	try:
+		game = LocalGame(modules, seed=seed)
+		winner = game.play(turns)
+	finally:
+		for name in names:
+			sys.modules.pop(name, None)
+
+	ours, theirs = side, 1 - side
+	counts = game.robot_counts()
+	return {
+		'result': 'draw' if winner is None else ('win' if winner == ours else 'loss'),
+		'robots': counts[ours],
+		'opponent_robots': counts[theirs],
+		'turn_ms': [t * 1000.0 for t in game.turn_times[ours]],
+		'exceptions': game.players[ours].exceptions,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Play a local match between two bot files.')
+	parser.add_argument('bot0')
+	parser.add_argument('bot1')
+	parser.add_argument('--seed', type=int, default=None)
+	parser.add_argument('--turns', type=int, default=None)
+	args = parser.parse_args()
+
+	if args.seed is not None:
+		without_deadline()
+	game = LocalGame([load_bot(args.bot0, 'player0'), load_bot(args.bot1, 'player1')], seed=args.seed)
+	winner = game.play(args.turns)
+	counts = game.robot_counts()
+	print('turns: %d, robots left: %d - %d, winner: %s' % (
+		game.turn, counts[0], counts[1], 'draw' if winner is None else 'player %d' % winner))
+	for player in game.players:
+		if player.exceptions:
+			print('player %d raised %d exceptions' % (player.player_id, player.exceptions))
+
+
+if __name__ == '__main__':
+	main()
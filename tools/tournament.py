@@ -0,0 +1,133 @@
+"""Tournament runner: plays a bot against itself and baseline opponents on a
+pool of worker processes, using the local simulator.
+
+Every match gets a deterministic seed (--seed plus the match index, the same
+for every opponent, so variants are compared on identical spawns), and the
+bot alternates sides from one match to the next. Each finished match is
+appended to the results file as a JSON line; running the same command
+again skips the matches already in it, so an interrupted run resumes where
+it stopped. The lookahead deadline is off unless STANCE_BOT_DEADLINE_MS is
+set, so a match's outcome depends on its seed alone, not on how loaded the
+pool is.
+
+Usage:
+	python tools/tournament.py [bot.py] [--opponent other.py ...] [--matches 100] [--results results.jsonl]"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator  # noqa: E402
+from benchmark import DEFAULT_BOT, percentile  # noqa: E402
+
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES = sorted(glob.glob(os.path.join(TOOLS_DIR, 'bots', '*.py')))
+
+
+def match_key(task):
+	return '%s|%s|%d|%s' % (task['bot'], task['opponent'], task['seed'], task['turns'])
+
+
+def play_match(task):
+	"""Worker: play one match and return its result as plain data."""
+
+	result = dict(task)
+	result.update(simulator.play_match(task['bot'], task['opponent'], task['seed'], task['side'], task['turns']))
+	result['key'] = match_key(task)
+	return result
+
+
+def load_results(path):
+	results = []
+	if os.path.exists(path):
+		with open(path) as f:
+			for line in f:
+				line = line.strip()
+				if line:
+					try:
+						results.append(json.loads(line))
+					except ValueError:
+						pass # a line cut short by the interruption
+	return results
+
+
+def summarize(results):
+	print('%-28s %6s %5s %5s %5s %8s %8s %8s %8s %8s' % (
+		'opponent', 'played', 'wins', 'loss', 'draw', 'win rate', 'robots', 'theirs', 'p50 ms', 'p99 ms'))
+
+	by_opponent = {}
+	for result in results:
+		by_opponent.setdefault(result['opponent'], []).append(result)
+
+	for opponent in sorted(by_opponent):
+		games = by_opponent[opponent]
+		wins = sum(1 for g in games if g['result'] == 'win')
+		losses = sum(1 for g in games if g['result'] == 'loss')
+		draws = len(games) - wins - losses
+		latencies = sorted(ms for g in games for ms in g['turn_ms'])
+		print('%-28s %6d %5d %5d %5d %7.1f%% %8.2f %8.2f %8.2f %8.2f' % (
+			os.path.basename(opponent), len(games), wins, losses, draws,
+			100.0 * (wins + 0.5 * draws) / len(games),
+			sum(g['robots'] for g in games) / float(len(games)),
+			sum(g['opponent_robots'] for g in games) / float(len(games)),
+			percentile(latencies, 0.5), percentile(latencies, 0.99)))
+
+
+def run(tasks, results_path, jobs):
+	"""Play the tasks not in the results file yet, appending each result as it comes."""
+
+	done = set(result['key'] for result in load_results(results_path))
+	todo = [task for task in tasks if match_key(task) not in done]
+	print('%d matches, %d already played, %d to go on %d processes' % (len(tasks), len(tasks) - len(todo), len(todo), jobs))
+
+	if todo:
+		pool = multiprocessing.Pool(jobs, maxtasksperchild=20)
+		try:
+			with open(results_path, 'a') as f:
+				for i, result in enumerate(pool.imap_unordered(play_match, todo)):
+					f.write(json.dumps(result) + '\n')
+					f.flush()
+					if (i + 1) % 10 == 0:
+						print('  %d/%d' % (i + 1, len(todo)))
+		finally:
+			pool.terminate()
+			pool.join()
+
+	keys = set(match_key(task) for task in tasks)
+	return [result for result in load_results(results_path) if result['key'] in keys]
+
+
+def make_tasks(bot, opponents, matches, seed, turns):
+	tasks = []
+	for opponent in opponents:
+		for i in range(matches):
+			tasks.append({'bot': bot, 'opponent': opponent, 'seed': seed + i, 'side': i % 2, 'turns': turns})
+	return tasks
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Play a bot against itself and baseline opponents in parallel.')
+	parser.add_argument('bot', nargs='?', default=DEFAULT_BOT)
+	parser.add_argument('--opponent', action='append', help='opponent bot file (default: the bot itself and tools/bots/*)')
+	parser.add_argument('--matches', type=int, default=50, help='matches per opponent')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--turns', type=int, default=None, help='turns per match (default: max_turns)')
+	parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count())
+	parser.add_argument('--results', default='tournament.jsonl', help='results file, appended to and resumed from')
+	args = parser.parse_args()
+
+	bot = os.path.abspath(args.bot)
+	opponents = [os.path.abspath(o) for o in (args.opponent or [bot] + BASELINES)]
+	results = run(make_tasks(bot, opponents, args.matches, args.seed, args.turns), args.results, args.jobs)
+	summarize(results)
+
+
+if __name__ == '__main__':
+	main()